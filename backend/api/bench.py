@@ -0,0 +1,135 @@
+"""Тестовые данные и замеры для бенчмарков API.
+
+Данные создаются внутри транзакции, которая откатывается
+после замеров, поэтому команды можно запускать на рабочей базе.
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientVolume,
+                            Recipe, ShoppingCard, Tag)
+from recipes.registry import registry
+from recipes.snapshot import refresh_snapshots
+from users.models import Follow
+
+User = get_user_model()
+
+
+def host_headers():
+    """
+    Первый адрес из ALLOWED_HOSTS, как в startup_profile: с Host
+    testserver тестового клиента запрос падает с DisallowedHost.
+    """
+    host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                 if '*' not in host), 'localhost')
+    return {'SERVER_NAME': host, 'HTTP_HOST': host}
+
+
+@contextmanager
+def rollback():
+    """
+    Всё, что создано внутри блока, откатывается при выходе.
+    Справочник процесса и индекс ингредиентов сбрасываются, чтобы
+    в них не остались откаченные данные.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+    finally:
+        registry.invalidate()
+        ingredient_index.invalidate()
+
+
+def make_recipes(count, ingredients_per_recipe=8, tags_per_recipe=2,
+                 authors=10):
+    """
+    Создаёт count рецептов и зрителя, который подписан на часть
+    авторов, добавил часть рецептов в избранное и в корзину.
+    Возвращает (зритель, список id рецептов).
+    """
+    prefix = f'bench{time.monotonic_ns()}'
+    viewer = User.objects.create(username=f'{prefix}_viewer',
+                                 email=f'{prefix}_viewer@bench.local')
+    User.objects.bulk_create(
+        User(username=f'{prefix}_{number}',
+             email=f'{prefix}_{number}@bench.local',
+             first_name='Имя', last_name='Фамилия')
+        for number in range(authors))
+    users = list(User.objects.filter(username__startswith=f'{prefix}_')
+                 .exclude(id=viewer.id))
+    tags = list(Tag.objects.all()[:tags_per_recipe])
+    # На пустой базе тегов нет; цвет у тега уникален.
+    used = set(Tag.objects.values_list('color', flat=True))
+    free = [color for color, _ in Tag.COLOR_CHOICE if color not in used]
+    for number, color in zip(range(tags_per_recipe - len(tags)), free):
+        tags.append(Tag.objects.create(
+            name=f'{prefix}_{number}', color=color, slug=f'{prefix}_{number}'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'{prefix}_{number}', measurement_unit='г')
+        for number in range(ingredients_per_recipe * 4))
+    ingredients = list(Ingredient.objects.filter(
+        name__startswith=f'{prefix}_'))
+    registry.invalidate()
+    Recipe.objects.bulk_create(
+        Recipe(author=users[number % len(users)], name=f'{prefix}_{number}',
+               image=f'recipes/{prefix}_{number}.jpg',
+               text='Описание рецепта ' * 20, cooking_time=10 + number % 50)
+        for number in range(count))
+    recipes = list(Recipe.objects.filter(
+        name__startswith=f'{prefix}_').values_list('id', flat=True))
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+        for recipe_id in recipes for tag in tags)
+    IngredientVolume.objects.bulk_create(
+        IngredientVolume(
+            recipe_id=recipe_id,
+            ingredient=ingredients[(number + shift) % len(ingredients)],
+            amount=shift + 1)
+        for number, recipe_id in enumerate(recipes)
+        for shift in range(ingredients_per_recipe))
+    Recipe.refresh_tags_mask(recipes)
+    refresh_snapshots(Recipe.objects.filter(id__in=recipes))
+    ingredient_index.changed(recipes)
+    Follow.objects.bulk_create(
+        Follow(user=viewer, author=author) for author in users[::2])
+    FavoriteRecipe.objects.bulk_create(
+        FavoriteRecipe(user=viewer, recipe_id=recipe_id)
+        for recipe_id in recipes[::3])
+    ShoppingCard.objects.bulk_create(
+        ShoppingCard(user=viewer, recipe_id=recipe_id)
+        for recipe_id in recipes[::4])
+    return viewer, recipes
+
+
+def make_request(user, path='/api/recipes/'):
+    request = Request(APIRequestFactory(**host_headers()).get(path))
+    request.user = user
+    return request
+
+
+def best_of(func, repeat=5):
+    """Лучшее время выполнения func в секундах из repeat попыток."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def count_queries(func):
+    """Результат func и число выполненных ею SQL-запросов."""
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as captured:
+        result = func()
+    return result, len(captured)
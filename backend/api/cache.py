@@ -0,0 +1,30 @@
+"""Версия закешированных ответов API.
+
+Ключ кеша ответа содержит версию; bump() делает устаревшими
+ответы всех процессов разом.
+"""
+import threading
+
+from django.db import transaction
+
+from recipes.local_cache import CacheVersion
+
+api_cache_version = CacheVersion('api_cache_version')
+
+_pending = threading.local()
+
+
+def invalidate_api_cache():
+    """
+    Версия меняется после коммита: иначе параллельный анонимный
+    запрос успел бы закешировать старую страницу под новой версией.
+    Сколько бы строк ни поменялось в транзакции, сброс один.
+    """
+    _pending.bump = True
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending():
+    if getattr(_pending, 'bump', False):
+        _pending.bump = False
+        api_cache_version.bump()
@@ -1,8 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.db.models import F
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from recipes.models import TAGS_MASK_BITS, Recipe, tags_mask
+from recipes.registry import registry
 
 User = get_user_model()
 
@@ -13,13 +15,29 @@ class IngredientSearchFilter(SearchFilter):
 
 class RecipeFilterBackend(FilterSet):
     """Фильтрация по избранному, автору, списку покупок и тегам."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [(tag.slug, tag.name)
+                         for tag in registry.get().tags.values()],
+        method='filter_tags',
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов: одно побитовое условие
+        по tags_mask вместо JOIN с таблицей связей и DISTINCT.
+        Если id тега не помещается в маску, фильтр идёт через JOIN.
+        """
+        if not value:
+            return queryset
+        tag_ids = [tag.id for tag in registry.get().tags.values()
+                   if tag.slug in value]
+        if any(tag_id >= TAGS_MASK_BITS for tag_id in tag_ids):
+            return queryset.filter(tags__id__in=tag_ids).distinct()
+        return queryset.alias(
+            tag_bits=F('tags_mask').bitand(tags_mask(tag_ids))
+        ).exclude(tag_bits=0)
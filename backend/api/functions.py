@@ -1,17 +1,72 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
 from rest_framework import status
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
-from recipes.models import Recipe
+from recipes.models import IngredientVolume, Recipe
 from api.serializers import ShowShortRecipesSerializer
 
 
+USER_STATE_KEY = 'recipes_user_state:{}'
+RECIPES_STATE_KEY = 'recipes_list_state'
+
+_pending = threading.local()
+
+
+def get_user_state(user):
+    """
+    Метка последнего изменения избранного, корзины и подписок
+    пользователя: от них зависят флаги в выдаче рецептов.
+    """
+    if user.is_anonymous:
+        return 0
+    return cache.get_or_set(USER_STATE_KEY.format(user.id), time.time, None)
+
+
+def touch_user_state(user):
+    """
+    Метка ставится после коммита: иначе параллельный запрос успел бы
+    закешировать ответ со старыми флагами уже под новой меткой.
+    """
+    transaction.on_commit(lambda: cache.set(
+        USER_STATE_KEY.format(user.id), time.time(), None))
+
+
+def get_recipes_state():
+    """Метка последнего изменения рецептов для выдачи: удаление тоже
+    её сдвигает, в отличие от Max(updated_at)."""
+    return cache.get_or_set(RECIPES_STATE_KEY, time.time, None)
+
+
+def touch_recipes_state():
+    """
+    Метка растёт хотя бы на секунду: If-Modified-Since точен до
+    секунды, и изменение в ту же секунду иначе дало бы 304.
+    Ставится один раз после коммита транзакции.
+    """
+    _pending.recipes = True
+    transaction.on_commit(flush_recipes_state)
+
+
+def flush_recipes_state():
+    if getattr(_pending, 'recipes', False):
+        _pending.recipes = False
+        cache.set(RECIPES_STATE_KEY,
+                  max(time.time(), get_recipes_state() + 1), None)
+
+
 def post_obj(model, user, pk):
     if model.objects.filter(user=user, recipe__id=pk).exists():
         return Response({'errors': 'Этот рецепт уже добавлен!'},
                         status=status.HTTP_400_BAD_REQUEST)
     recipe = get_object_or_404(Recipe, id=pk)
     model.objects.create(user=user, recipe=recipe)
+    touch_user_state(user)
     serializer = ShowShortRecipesSerializer(recipe)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -20,6 +75,32 @@ def del_obj(model, user, pk):
     recipe = model.objects.filter(user=user, recipe__id=pk)
     if recipe.exists():
         recipe.delete()
+        touch_user_state(user)
         return Response(status=status.HTTP_204_NO_CONTENT)
     return Response({'errors': 'Вы уже удалили рецепт'},
                     status=status.HTTP_400_BAD_REQUEST)
+
+
+def parse_ids(value):
+    """Список id из строки вида '1,2,3'; None, если строка некорректна."""
+    if not value:
+        return None
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        return None
+
+
+def get_shopping_list(user):
+    """Ингредиенты из корзины, сложенные по названию и единице:
+    список [название, единица, количество]."""
+    ingredients = IngredientVolume.objects.filter(
+        recipe__cart__user=user).values(
+            'ingredient__name',
+            'ingredient__measurement_unit').annotate(
+                total=Sum('amount')).order_by('ingredient__name')
+    return [
+        [item['ingredient__name'], item['ingredient__measurement_unit'],
+         item['total']]
+        for item in ingredients
+    ]
@@ -0,0 +1,314 @@
+"""Server-sent events о новых рецептах авторов из подписок.
+
+Рецепт, созданный через RecipeSerializer.create, после коммита
+публикуется в канал PostgreSQL LIVE_CHANNEL. Каждый ASGI-процесс
+держит одно соединение с LISTEN на этот канал и рассылает событие
+тем подключённым к нему пользователям, которые подписаны на автора.
+Очередь клиента ограничена LIVE_QUEUE_SIZE: отстающий клиент
+отключается и при переподключении догоняет пропущенное
+по Last-Event-ID.
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import (DEFAULT_DB_ALIAS, close_old_connections, connection,
+                       connections, transaction)
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+from users.models import Follow
+
+logger = logging.getLogger('api.live')
+
+
+def notify_new_recipe(recipe):
+    """Публикует рецепт в LIVE_CHANNEL после коммита транзакции."""
+    if connection.vendor != 'postgresql':
+        return
+    payload = json.dumps({'id': recipe.id, 'author': recipe.author_id,
+                          'name': recipe.name}, ensure_ascii=False)
+
+    def publish():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           (settings.LIVE_CHANNEL, payload))
+
+    transaction.on_commit(publish)
+
+
+def format_event(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return f'id: {event["id"]}\nevent: recipe\ndata: {data}\n\n'.encode()
+
+
+def database(func):
+    """ORM из цикла событий: в потоке, со сбросом устаревших соединений."""
+
+    def wrapper(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper)
+
+
+@database
+def authenticate(key):
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user_id
+
+
+@database
+def followers_among(author_id, user_ids):
+    return set(Follow.objects.filter(
+        author_id=author_id, user_id__in=user_ids).values_list(
+            'user_id', flat=True))
+
+
+@database
+def missed_recipes(user_id, last_id):
+    authors = Follow.objects.filter(user_id=user_id).values('author')
+    rows = Recipe.objects.filter(
+        author__in=authors, id__gt=last_id).order_by('id').values_list(
+            'id', 'author_id', 'name')[:settings.LIVE_BACKLOG_LIMIT]
+    return [{'id': pk, 'author': author, 'name': name}
+            for pk, author, name in rows]
+
+
+class Subscriber:
+    __slots__ = ('user_id', 'queue')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(settings.LIVE_QUEUE_SIZE)
+
+    def push(self, message):
+        """Не ждёт клиента: при переполнении очередь заменяется на None."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Hub:
+    """Подписчики процесса по id пользователя и соединение с LISTEN."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.count = 0
+        self.listener = None
+        self.starting = None
+
+    def add(self, subscriber):
+        self.subscribers.setdefault(subscriber.user_id, set()).add(
+            subscriber)
+        self.count += 1
+        if self.listener is None and self.starting is None:
+            self.starting = asyncio.ensure_future(self.start())
+
+    def remove(self, subscriber):
+        subscribers = self.subscribers.get(subscriber.user_id, set())
+        subscribers.discard(subscriber)
+        if not subscribers:
+            self.subscribers.pop(subscriber.user_id, None)
+        self.count -= 1
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        try:
+            if connections[DEFAULT_DB_ALIAS].vendor != 'postgresql':
+                logger.info('LISTEN доступен только с PostgreSQL')
+                return
+            self.listener = await loop.run_in_executor(None, self.connect)
+            loop.add_reader(self.listener.fileno(), self.read)
+        except psycopg2.Error:
+            logger.exception('Нет соединения для LISTEN, повтор через %s с',
+                             settings.LIVE_RECONNECT_SECONDS)
+            loop.call_later(settings.LIVE_RECONNECT_SECONDS, self.restart)
+        finally:
+            self.starting = None
+
+    def connect(self):
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        listener = psycopg2.connect(**params)
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN "{settings.LIVE_CHANNEL}"')
+        return listener
+
+    def restart(self):
+        if self.starting is None:
+            self.starting = asyncio.ensure_future(self.start())
+
+    def close(self):
+        if self.listener is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.listener.fileno())
+        self.listener.close()
+        self.listener = None
+
+    def read(self):
+        try:
+            self.listener.poll()
+        except psycopg2.Error:
+            logger.exception('Соединение LISTEN потеряно')
+            self.close()
+            asyncio.get_running_loop().call_later(
+                settings.LIVE_RECONNECT_SECONDS, self.restart)
+            return
+        while self.listener.notifies:
+            notify = self.listener.notifies.pop(0)
+            asyncio.ensure_future(self.dispatch(json.loads(notify.payload)))
+
+    async def dispatch(self, event):
+        if not self.subscribers:
+            return
+        user_ids = await followers_among(event['author'],
+                                         list(self.subscribers))
+        message = format_event(event)
+        for user_id in user_ids:
+            for subscriber in self.subscribers.get(user_id, ()):
+                subscriber.push(message)
+
+
+hub = Hub()
+
+
+def get_header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def respond(send, status, detail, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': detail}, ensure_ascii=False).encode(),
+    })
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(subscriber, receive, send):
+    """Отдаёт события и пинги, пока клиент подключён и успевает читать."""
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnected},
+                timeout=settings.LIVE_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                getter.cancel()
+                return
+            if getter in done:
+                message = getter.result()
+                if message is None:
+                    break
+            else:
+                getter.cancel()
+                message = b': ping\n\n'
+            await asyncio.wait_for(
+                send({'type': 'http.response.body', 'body': message,
+                      'more_body': True}),
+                settings.LIVE_SEND_TIMEOUT)
+        await send({'type': 'http.response.body', 'body': b''})
+    except (asyncio.TimeoutError, OSError):
+        logger.info('Клиент %s не успевает читать события',
+                    subscriber.user_id)
+    finally:
+        disconnected.cancel()
+
+
+async def live_recipes(scope, receive, send):
+    if scope['method'] != 'GET':
+        await respond(send, 405, 'Метод не разрешён.')
+        return
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    # EventSource в браузере не умеет передавать заголовки.
+    authorization = get_header(scope, b'authorization') or ''
+    key = (authorization[6:] if authorization.startswith('Token ')
+           else query.get('token', [''])[0])
+    user_id = await authenticate(key) if key else None
+    if user_id is None:
+        await respond(send, 401, 'Учетные данные не были предоставлены.')
+        return
+    if hub.count >= settings.LIVE_MAX_CONNECTIONS:
+        await respond(send, 503, 'Слишком много подключений.',
+                      ((b'retry-after', b'30'),))
+        return
+    last_id = (get_header(scope, b'last-event-id')
+               or query.get('lastEventId', [''])[0])
+    backlog = []
+    if last_id.isdigit():
+        backlog = await missed_recipes(user_id, int(last_id))
+
+    subscriber = Subscriber(user_id)
+    hub.add(subscriber)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        retry = settings.LIVE_RECONNECT_SECONDS * 1000
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {retry}\n\n'.encode() + b''.join(
+                format_event(event) for event in backlog),
+            'more_body': True,
+        })
+        await stream(subscriber, receive, send)
+    finally:
+        hub.remove(subscriber)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            hub.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def with_live_recipes(application):
+    """ASGI-приложение Django с потоком событий на LIVE_RECIPES_PATH."""
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await lifespan(receive, send)
+        elif (scope['type'] == 'http'
+                and scope['path'] == settings.LIVE_RECIPES_PATH):
+            await live_recipes(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,91 @@
+import json
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.bench import best_of
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+
+User = get_user_model()
+
+DEFAULT_PATHS = (
+    '/api/recipes/?limit=50',
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/users/subscriptions/?limit=50',
+)
+
+
+class Command(BaseCommand):
+    help = ('Запись реальных ответов API и сравнение скорости '
+            'JSONRenderer/JSONParser и их версий на orjson.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=os.path.join(settings.BASE_DIR, 'benchmarks',
+                                          'responses'),
+            help='Каталог с записанными ответами')
+        parser.add_argument('--record', action='store_true',
+                            help='Сначала записать ответы по --path')
+        parser.add_argument('--path', action='append',
+                            help='Адрес для записи, можно несколько раз')
+        parser.add_argument('--email',
+                            help='Пользователь, от имени которого писать')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        if options['record']:
+            self.record(directory, options['path'] or DEFAULT_PATHS,
+                        options['email'])
+        if not os.path.isdir(directory):
+            raise CommandError(f'Нет записанных ответов в {directory}, '
+                               'запустите с --record')
+        self.stdout.write(
+            f'{"response":<40} {"KiB":>7} {"render":>14} {"parse":>14} '
+            f'{"same":>5}')
+        for filename in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, filename), 'rb') as file:
+                raw = file.read()
+            self.bench(filename, raw, options['repeat'])
+
+    def record(self, directory, paths, email):
+        client = APIClient()
+        if email:
+            client.force_authenticate(User.objects.get(email=email))
+        os.makedirs(directory, exist_ok=True)
+        for path in paths:
+            response = client.get(path, HTTP_ACCEPT='application/json')
+            if response.status_code != 200:
+                self.stderr.write(f'{path}: {response.status_code}, пропуск')
+                continue
+            name = path.strip('/').replace('/', '_').replace('?', '__')
+            with open(os.path.join(directory, f'{name}.json'), 'wb') as file:
+                file.write(response.content)
+            self.stdout.write(f'{path}: записано {len(response.content)} B')
+
+    def bench(self, name, raw, repeat):
+        data = json.loads(raw)
+        stdlib, fast = JSONRenderer(), FastJSONRenderer()
+        rendered = stdlib.render(data)
+        same = rendered == fast.render(data)
+        render = (best_of(lambda: stdlib.render(data), repeat),
+                  best_of(lambda: fast.render(data), repeat))
+
+        def parse(parser):
+            return parser.parse(BytesIO(rendered))
+
+        parse_time = (best_of(lambda: parse(JSONParser()), repeat),
+                      best_of(lambda: parse(FastJSONParser()), repeat))
+        self.stdout.write(
+            f'{name[:40]:<40} {len(raw) / 1024:>7.1f} '
+            f'{render[0] / render[1]:>13.1f}x '
+            f'{parse_time[0] / parse_time[1]:>13.1f}x '
+            f'{"yes" if same else "NO":>5}')
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from api.bench import best_of, make_recipes, make_request, rollback
+from api.serializers import RecipeReadSerializer, RecipeSerializer
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Сравнение RecipeSerializer и RecipeReadSerializer '
+            'на страницах разного размера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[5, 50, 500])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        renderer = JSONRenderer()
+        with rollback():
+            viewer, recipes = make_recipes(max(sizes))
+            context = {'request': make_request(viewer)}
+            self.stdout.write(
+                f'{"size":>6} {"drf, ms":>10} {"fast, ms":>10} '
+                f'{"speedup":>8} {"queries":>9} {"same":>5}')
+            for size in sizes:
+                ids = recipes[:size]
+
+                def render(serializer_class):
+                    page = list(Recipe.objects.filter(id__in=ids))
+                    return renderer.render(serializer_class(
+                        page, many=True, context=context).data)
+
+                # Число запросов берётся сразу: после очистки журнала
+                # captured_queries первого замера уже не прочитать.
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    expected = render(RecipeSerializer)
+                drf_queries = len(captured)
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    actual = render(RecipeReadSerializer)
+                fast_queries = len(captured)
+                drf = best_of(lambda: render(RecipeSerializer),
+                              options['repeat'])
+                fast = best_of(lambda: render(RecipeReadSerializer),
+                               options['repeat'])
+                self.stdout.write(
+                    f'{size:>6} {drf * 1000:>10.2f} {fast * 1000:>10.2f} '
+                    f'{drf / fast:>7.1f}x '
+                    f'{drf_queries:>4}/{fast_queries:<4} '
+                    f'{"yes" if expected == actual else "NO":>5}')
@@ -0,0 +1,252 @@
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, ShoppingCard, Tag
+from recipes.trending import update_trending
+from users.models import Follow
+
+from api.bench import (best_of, count_queries, host_headers, make_recipes,
+                       make_request, rollback)
+from api.functions import get_shopping_list
+from api.serializers import (CustomUserSerializer, FollowSerializer,
+                             RecipeSerializer)
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'bench-password'
+
+# Маршруты api.urls: (имя, метод, аргументы адреса, query string, тело).
+# Значения аргументов - имена объектов из fixtures() ниже.
+ROUTES = (
+    ('api-root', 'get', {}, '', None),
+    ('api_tags-list', 'get', {}, '', None),
+    ('api_tags-detail', 'get', {'pk': 'tag'}, '', None),
+    ('api_ingredients-list', 'get', {}, 'name=bench', None),
+    ('api_ingredients-detail', 'get', {'pk': 'ingredient'}, '', None),
+    ('api_recipes-list', 'get', {}, 'limit=50', None),
+    ('api_recipes-detail', 'get', {'pk': 'recipe'}, '', None),
+    ('api_recipes-feed', 'get', {}, 'limit=50', None),
+    ('api_recipes-similar', 'get', {'pk': 'recipe'}, '', None),
+    ('api_recipes-batch', 'get', {}, 'ids={batch}', None),
+    ('api_recipes-trending', 'get', {}, 'limit=50', None),
+    ('api_recipes-what-to-cook', 'get', {}, 'ingredients={ingredients}',
+     None),
+    ('api_recipes-download-shopping-cart', 'get', {}, '', None),
+    ('api_recipes-favorite', 'post', {'pk': 'recipe'}, '', None),
+    ('api_recipes-shopping-cart', 'post', {'pk': 'recipe'}, '', None),
+    ('subscriptions', 'get', {}, 'limit=50', None),
+    ('subscribe', 'post', {'user_id': 'author'}, '', None),
+    ('user-list', 'get', {}, 'limit=50', None),
+    ('user-detail', 'get', {'id': 'author'}, '', None),
+    ('user-me', 'get', {}, '', None),
+    ('login', 'post', {}, '', 'credentials'),
+    ('logout', 'post', {}, '', None),
+)
+
+
+def route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+class Command(BaseCommand):
+    help = ('Замеры сериализаторов и агрегации списка покупок '
+            'на разных объёмах данных и число SQL-запросов для '
+            'маршрутов api.urls; сравнение с сохранённым эталоном.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 100, 500])
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--baseline',
+            help='Файл эталона, по умолчанию '
+                 'benchmarks/baseline-<СУБД>.json')
+        parser.add_argument('--save', action='store_true',
+                            help='Записать результаты как новый эталон')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимое замедление, доля')
+        parser.add_argument('--check', action='store_true',
+                            help='Завершиться с ошибкой при регрессиях')
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks',
+            f'baseline-{connection.vendor}.json')
+        with rollback():
+            results = {
+                'serializers': self.bench_serializers(
+                    options['sizes'], options['repeat']),
+                'routes': self.bench_routes(),
+            }
+        if options['save']:
+            os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+            with open(baseline_path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f'Эталон записан в {baseline_path}')
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path, encoding='utf-8') as file:
+                baseline = json.load(file)
+        regressions = self.report(results, baseline, options['tolerance'])
+        if regressions and options['check']:
+            raise CommandError(f'Регрессий: {regressions}')
+
+    def bench_serializers(self, sizes, repeat):
+        largest = max(sizes)
+        viewer, recipes = make_recipes(largest, authors=largest * 2)
+        context = {'request': make_request(viewer)}
+        follows = list(Follow.objects.filter(user=viewer).values_list(
+            'id', flat=True))
+        authors = list(Follow.objects.filter(user=viewer).values_list(
+            'author_id', flat=True))
+        carts = {size: self.cart_user(recipes[:size]) for size in sizes}
+        cases = {
+            'RecipeSerializer': lambda size: RecipeSerializer(
+                list(Recipe.objects.filter(id__in=recipes[:size])),
+                many=True, context=context).data,
+            'FollowSerializer': lambda size: FollowSerializer(
+                list(Follow.objects.filter(id__in=follows[:size])),
+                many=True, context=context).data,
+            'CustomUserSerializer': lambda size: CustomUserSerializer(
+                list(User.objects.filter(id__in=authors[:size])),
+                many=True, context=context).data,
+            'shopping_list': lambda size: get_shopping_list(carts[size]),
+        }
+        results = {}
+        for name, case in cases.items():
+            results[name] = {}
+            for size in sizes:
+                _, queries = count_queries(lambda: case(size))
+                elapsed = best_of(lambda: case(size), repeat)
+                results[name][str(size)] = {
+                    'ms': round(elapsed * 1000, 2), 'queries': queries}
+        return results
+
+    def cart_user(self, recipe_ids):
+        """Пользователь с заданными рецептами в корзине."""
+        username = f'bench_cart_{len(recipe_ids)}'
+        user = User.objects.create(username=username,
+                                   email=f'{username}@bench.local')
+        ShoppingCard.objects.bulk_create(
+            ShoppingCard(user=user, recipe_id=recipe_id)
+            for recipe_id in recipe_ids)
+        return user
+
+    def fixtures(self):
+        viewer, recipes = make_recipes(20, authors=10)
+        viewer.is_staff = True
+        viewer.set_password(BENCH_PASSWORD)
+        viewer.save()
+        # Сдвиг на TRENDING_LAG_SECONDS, чтобы учесть только что
+        # созданные избранное и корзину.
+        update_trending(timezone.now() + timedelta(
+            seconds=settings.TRENDING_LAG_SECONDS))
+        followed = Follow.objects.filter(user=viewer).values('author')
+        recipe = Recipe.objects.filter(id__in=recipes).exclude(
+            author__in=followed).exclude(cart__user=viewer).exclude(
+                favorite_recipe__user=viewer).first()
+        ingredients = Ingredient.objects.filter(
+            recipies__id__in=recipes).values_list('id', flat=True)
+        return viewer, {
+            'tag': Tag.objects.values_list('id', flat=True).first(),
+            'ingredient': ingredients[0],
+            'recipe': recipe.id,
+            'author': recipe.author_id,
+            'batch': ','.join(map(str, recipes[:10])),
+            'ingredients': ','.join(map(str, list(ingredients[:5]))),
+            'credentials': {'email': viewer.email,
+                            'password': BENCH_PASSWORD},
+        }
+
+    def bench_routes(self):
+        viewer, values = self.fixtures()
+        token = Token.objects.create(user=viewer)
+        client = APIClient(**host_headers())
+        results = {}
+        for name, method, kwargs, query, body in ROUTES:
+            url = reverse(f'api:{name}', kwargs={
+                key: values[value] for key, value in kwargs.items()})
+            if query:
+                url = f'{url}?{query.format(**values)}'
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            request = getattr(client, method)
+            response, queries = count_queries(lambda: request(
+                url, values[body] if body else None, format='json'))
+            results[name] = {'queries': queries,
+                             'status': response.status_code}
+            if name == 'logout':
+                token = Token.objects.create(user=viewer)
+        missing = set(route_names(get_resolver('api.urls').url_patterns))
+        missing.difference_update(results)
+        for name in sorted(missing):
+            results[name] = None
+        return results
+
+    def report(self, results, baseline, tolerance):
+        """Печатает сравнение с эталоном, возвращает число регрессий."""
+        regressions = self.report_serializers(
+            results['serializers'], baseline.get('serializers', {}),
+            tolerance)
+        return regressions + self.report_routes(
+            results['routes'], baseline.get('routes', {}))
+
+    def report_serializers(self, results, baseline, tolerance):
+        regressions = 0
+        self.stdout.write(
+            f'{"serializer":<24} {"size":>6} {"ms":>9} {"base":>9} '
+            f'{"queries":>8} {"base":>6}')
+        for name, sizes in results.items():
+            for size, current in sizes.items():
+                base = baseline.get(name, {}).get(size)
+                mark = ''
+                if base is not None:
+                    if current['queries'] > base['queries']:
+                        mark += ' запросов больше'
+                    if current['ms'] > base['ms'] * (1 + tolerance):
+                        mark += ' медленнее'
+                regressions += bool(mark)
+                self.stdout.write(
+                    f'{name:<24} {size:>6} {current["ms"]:>9.2f} '
+                    f'{base["ms"] if base else "-":>9} '
+                    f'{current["queries"]:>8} '
+                    f'{base["queries"] if base else "-":>6}'
+                    + (self.style.ERROR(mark) if mark else ''))
+        return regressions
+
+    def report_routes(self, results, baseline):
+        regressions = 0
+        self.stdout.write(f'\n{"route":<36} {"status":>6} {"queries":>8} '
+                          f'{"base":>6}')
+        for name, current in sorted(results.items()):
+            if current is None:
+                self.stdout.write(f'{name:<36} {"не замеряется":>22}')
+                continue
+            base = baseline.get(name)
+            mark = ''
+            if base is not None:
+                if current['queries'] > base['queries']:
+                    mark += ' запросов больше'
+                if current['status'] != base['status']:
+                    mark += ' другой статус'
+            regressions += bool(mark)
+            self.stdout.write(
+                f'{name:<36} {current["status"]:>6} '
+                f'{current["queries"]:>8} '
+                f'{base["queries"] if base else "-":>6}'
+                + (self.style.ERROR(mark) if mark else ''))
+        return regressions
@@ -0,0 +1,67 @@
+import io
+import os
+import pstats
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import MEMORY_SUFFIX, PROFILE_SUFFIX
+
+
+class Command(BaseCommand):
+    help = ('Сводка по профилям из PROFILING_DIR: самые затратные '
+            'функции и строки с наибольшими выделениями памяти '
+            'для каждого вьюсета и action.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DIR)
+        parser.add_argument('--view', action='append',
+                            help='Только указанные Вьюсет.action')
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--sort', default='cumulative',
+                            choices=('cumulative', 'tottime', 'ncalls'))
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Нет профилей в {directory}')
+        views = sorted(options['view'] or os.listdir(directory))
+        for view in views:
+            path = os.path.join(directory, view)
+            if not os.path.isdir(path):
+                continue
+            files = sorted(os.listdir(path))
+            profiles = [os.path.join(path, name) for name in files
+                        if name.endswith(PROFILE_SUFFIX)]
+            snapshots = [os.path.join(path, name) for name in files
+                         if name.endswith(MEMORY_SUFFIX)]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{view}: профилей {len(profiles)}, '
+                f'снимков памяти {len(snapshots)}'))
+            if profiles:
+                self.report_cpu(profiles, options['sort'], options['top'])
+            if snapshots:
+                self.report_memory(snapshots, options['top'])
+
+    def report_cpu(self, profiles, sort, top):
+        stream = io.StringIO()
+        stats = pstats.Stats(*profiles, stream=stream)
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
+        self.stdout.write(stream.getvalue())
+
+    def report_memory(self, snapshots, top):
+        """Выделения по строкам, сложенные по всем снимкам."""
+        totals = {}
+        for path in snapshots:
+            statistics = tracemalloc.Snapshot.load(path).statistics('lineno')
+            for stat in statistics:
+                frame = stat.traceback[0]
+                key = f'{frame.filename}:{frame.lineno}'
+                size, count = totals.get(key, (0, 0))
+                totals[key] = (size + stat.size, count + stat.count)
+        self.stdout.write(f'{"KiB":>10} {"blocks":>8}  line')
+        for key, (size, count) in sorted(
+                totals.items(), key=lambda item: -item[1][0])[:top]:
+            self.stdout.write(f'{size / 1024:>10.1f} {count:>8}  {key}')
+        self.stdout.write('')
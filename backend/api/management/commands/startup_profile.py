@@ -0,0 +1,110 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в чистом интерпретаторе с -X importtime: загрузка
+# foodgram.wsgi и первый запрос, как у только что запущенного воркера.
+CHILD = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+start = time.perf_counter()
+from foodgram.wsgi import application
+booted = time.perf_counter()
+from django.conf import settings
+host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+             if '*' not in host), 'localhost')
+environ = {'PATH_INFO': sys.argv[1], 'REQUEST_METHOD': 'GET',
+           'HTTP_HOST': host, 'SERVER_NAME': host}
+setup_testing_defaults(environ)
+status = []
+body = application(environ, lambda code, headers, *args: status.append(code))
+for _ in body:
+    pass
+body.close()
+done = time.perf_counter()
+print(json.dumps({'boot': (booted - start) * 1000,
+                  'request': (done - booted) * 1000,
+                  'status': status[0]}))
+'''
+
+
+def parse_importtime(stderr):
+    """Строки -X importtime -> [(модуль, своё время, суммарное), ...] в мс."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(own) / 1000,
+                        int(cumulative) / 1000))
+    return modules
+
+
+class Command(BaseCommand):
+    help = ('Время импорта модулей при запуске воркера и время '
+            'первого запроса к foodgram.wsgi; с --budget падает, '
+            'если запуск медленнее бюджета.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/tags/',
+                            help='Адрес первого запроса')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Запусков, берётся лучший')
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--budget', type=float,
+                            default=settings.STARTUP_BUDGET_MS,
+                            help='Бюджет на загрузку и первый запрос, мс')
+
+    def handle(self, *args, **options):
+        best = None
+        for _ in range(options['repeat']):
+            run = self.run_child(options['path'])
+            if best is None or self.total(run) < self.total(best):
+                best = run
+        timings, modules = best
+
+        packages = defaultdict(float)
+        for name, own, _ in modules:
+            packages[name.split('.')[0]] += own
+        top = options['top']
+        self.stdout.write(f'{"package":<45} {"self, ms":>10}')
+        for name, own in sorted(packages.items(), key=lambda item: -item[1])[
+                :top]:
+            self.stdout.write(f'{name:<45} {own:>10.1f}')
+        self.stdout.write(f'\n{"module":<45} {"self, ms":>10} '
+                          f'{"cumulative":>11}')
+        for name, own, cumulative in sorted(
+                modules, key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'{name:<45} {own:>10.1f} {cumulative:>11.1f}')
+
+        total = self.total(best)
+        self.stdout.write(
+            f'\nимпорт модулей: {sum(own for _, own, _ in modules):.1f} мс, '
+            f'загрузка foodgram.wsgi: {timings["boot"]:.1f} мс, '
+            f'первый запрос {options["path"]} ({timings["status"]}): '
+            f'{timings["request"]:.1f} мс, всего {total:.1f} мс')
+        if options['budget'] and total > options['budget']:
+            raise CommandError(f'Запуск занимает {total:.1f} мс, бюджет '
+                               f'{options["budget"]:.0f} мс')
+
+    def run_child(self, path):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            filter(None, (settings.BASE_DIR, env.get('PYTHONPATH'))))
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+        result = subprocess.run(
+            (sys.executable, '-X', 'importtime', '-c', CHILD, path),
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        return json.loads(result.stdout), parse_importtime(result.stderr)
+
+    @staticmethod
+    def total(run):
+        timings, _ = run
+        return timings['boot'] + timings['request']
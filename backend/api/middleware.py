@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import InterfaceError, OperationalError
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_router import ReplicaState, mark_down, replica_state
+
+from api.cache import api_cache_version
+
+logger = logging.getLogger('api.middleware')
+
+SKIPPED_HEADERS = ('content-length',)
+# Ответ-метка из process_exception: __call__ повторяет запрос.
+REPLICA_FAILED = HttpResponse(status=503)
+
+
+def accepted_encodings(header):
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00'):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def negotiate_encoding(request):
+    encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING',
+                                                    ''))
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.API_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.API_GZIP_LEVEL,
+                         mtime=0)
+
+
+class ApiCompressionMiddleware:
+    """
+    Сжатие ответов /api/ больше API_COMPRESSION_MIN_SIZE байт:
+    brotli, если он установлен и клиент его принимает, иначе gzip.
+    Анонимные GET-запросы к API_CACHED_PATHS кешируются уже сжатыми,
+    чтобы не сжимать один и тот же ответ на каждом попадании.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        encoding = negotiate_encoding(request)
+        key = self.cache_key(request, encoding)
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return self.from_cache(request, *cached)
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.status_code == 200 and not response.streaming:
+            self.compress(response, encoding)
+            if key is not None and self.is_cacheable(response):
+                cache.set(key, (list(response.items()), response.content),
+                          settings.API_CACHE_TIMEOUT)
+        return response
+
+    def cache_key(self, request, encoding):
+        if (request.method != 'GET'
+                or 'HTTP_AUTHORIZATION' in request.META
+                or not request.path.startswith(settings.API_CACHED_PATHS)):
+            return None
+        url = '|'.join((request.get_full_path(),
+                        request.META.get('HTTP_ACCEPT', '')))
+        return 'api_response:{}:{}:{}'.format(
+            api_cache_version.get(), encoding or 'identity',
+            hashlib.md5(url.encode()).hexdigest())
+
+    def is_cacheable(self, response):
+        return (not response.cookies
+                and 'private' not in response.get('Cache-Control', ''))
+
+    def compress(self, response, encoding):
+        if (encoding is None or response.has_header('Content-Encoding')
+                or len(response.content) < settings.API_COMPRESSION_MIN_SIZE):
+            return
+        response.content = compress(response.content, encoding)
+        response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+    def from_cache(self, request, headers, content):
+        headers = dict(headers)
+        not_modified = get_conditional_response(
+            request, etag=headers.get('ETag'))
+        response = not_modified or HttpResponse(content)
+        for header, value in headers.items():
+            if header.lower() not in SKIPPED_HEADERS:
+                response[header] = value
+        if not_modified is None:
+            response['Content-Length'] = str(len(content))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Безопасные запросы к action из replica_actions вьюсета читают
+    с реплик. После успешной записи клиент ещё
+    DB_PRIMARY_STICKY_SECONDS читает с основной базы,
+    чтобы сразу видеть свои изменения.
+    Флаг ставится в состоянии запроса, а не вокруг вызова
+    представления: так отрабатывают process_exception остальных
+    middleware и ATOMIC_REQUESTS.
+    Если реплика отвалилась посреди запроса, она исключается,
+    а запрос один раз повторяется на основной базе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = ReplicaState()
+        token = replica_state.set(state)
+        try:
+            response = self.get_response(request)
+            if response is REPLICA_FAILED:
+                state.enabled = False
+                state.used = None
+                request.replica_retry = True
+                response = self.get_response(request)
+        finally:
+            replica_state.reset(token)
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            cache.set(self.pin_key(request), True,
+                      settings.DB_PRIMARY_STICKY_SECONDS)
+        return response
+
+    def pin_key(self, request):
+        ident = (request.META.get('HTTP_AUTHORIZATION')
+                 or request.META.get('REMOTE_ADDR', ''))
+        return 'db_pin:' + hashlib.md5(ident.encode()).hexdigest()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method not in SAFE_METHODS
+                or getattr(request, 'replica_retry', False)):
+            return None
+        actions = getattr(view_func, 'actions', None) or {}
+        replica_actions = getattr(getattr(view_func, 'cls', None),
+                                  'replica_actions', ())
+        if actions.get(request.method.lower()) not in replica_actions:
+            return None
+        if cache.get(self.pin_key(request)):
+            return None
+        state = replica_state.get()
+        if state is not None:
+            state.enabled = True
+        return None
+
+    def process_exception(self, request, exception):
+        state = replica_state.get()
+        if (state is None or state.used is None
+                or not isinstance(exception, (OperationalError,
+                                              InterfaceError))):
+            return None
+        logger.warning('Реплика %s недоступна, повтор на основной базе',
+                       state.used)
+        mark_down(state.used)
+        return REPLICA_FAILED
@@ -1,8 +1,95 @@
+import hashlib
+from contextlib import ExitStack
+
+from django.db import OperationalError, connections
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import mixins, viewsets
 
+from api.functions import get_recipes_state, get_user_state
+from api.query_limits import (QueryGuard, QueryTimeout, TooManyQueries,
+                              is_query_canceled, logger)
+
 
 class ListCreateDeleteViewSet(mixins.CreateModelMixin,
                               mixins.DestroyModelMixin,
                               mixins.ListModelMixin,
                               viewsets.GenericViewSet):
     pass
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для list и retrieve.
+    Валидаторы берутся из меток в кеше, без запросов к базе:
+    общей метки рецептов и метки пользователя. При совпадении
+    с If-None-Match/If-Modified-Since отдаётся 304.
+    """
+
+    def get_validators(self):
+        recipes = get_recipes_state()
+        state = get_user_state(self.request.user)
+        key = '|'.join(map(str, (
+            self.request.get_full_path(), self.request.accepted_media_type,
+            self.request.user.id, recipes, state,
+        )))
+        return hashlib.md5(key.encode()).hexdigest(), int(max(recipes, state))
+
+    def conditional(self, view, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(
+            self.request, etag=quote_etag(etag), last_modified=last_modified)
+        if response is None:
+            response = view(self.request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = quote_etag(etag)
+                response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, *args, **kwargs)
+
+
+class QueryLimitMixin:
+    """
+    Ограничения из словаря query_limits (action -> QueryLimit):
+    statement_timeout и число SQL-запросов. Отмена по таймауту
+    превращается в 503, превышение числа запросов - в 422,
+    оба случая пишутся в лог api.query_limits.
+    """
+    query_limits = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        limit = self.query_limits.get(action)
+        if limit is None:
+            return super().dispatch(request, *args, **kwargs)
+        self.query_guard = QueryGuard(limit)
+        with ExitStack() as stack:
+            # Выполняется последним, когда обёртки уже сняты.
+            stack.callback(self.query_guard.reset)
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(self.query_guard))
+            return super().dispatch(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, OperationalError) and is_query_canceled(exc):
+            exc = QueryTimeout()
+        if isinstance(exc, (QueryTimeout, TooManyQueries)):
+            guard = getattr(self, 'query_guard', None)
+            logger.warning(
+                'query limit exceeded', extra={
+                    'view': type(self).__name__,
+                    'action': getattr(self, 'action', None),
+                    'reason': exc.default_code,
+                    'queries': guard.count if guard else None,
+                    'limit': guard.limit._asdict() if guard else None,
+                    'path': self.request.path,
+                    'user_id': getattr(self.request.user, 'pk', None),
+                })
+        return super().handle_exception(exc)
@@ -1,6 +1,15 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация для ленты рецептов: без OFFSET и COUNT(*)."""
+    page_size = 5
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = '-id'
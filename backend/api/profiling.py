@@ -0,0 +1,105 @@
+"""Профилирование отдельных запросов в рабочем окружении.
+
+Запрос профилируется, если его прислал сотрудник с заголовком
+X-Profile (значение memory добавляет tracemalloc) или если он попал
+в случайную выборку PROFILING_SAMPLE_RATE. Результаты складываются
+в PROFILING_DIR/<Вьюсет.action>/ и сводятся командой profile_report.
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PROFILE_SUFFIX = '.prof'
+MEMORY_SUFFIX = '.tracemalloc'
+
+# tracemalloc общий для всех потоков процесса, поэтому одновременно
+# профилируется только один запрос, остальные идут как обычно.
+_busy = threading.Lock()
+
+
+def view_name(request):
+    """Имя вида RecipeViewSet.list или имя функции представления."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    cls = getattr(func, 'cls', None)
+    if cls is None:
+        return getattr(func, '__name__', 'view')
+    actions = getattr(func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class ProfilingMiddleware:
+    """
+    Заголовок X-Profile учитывается только у персонала; токен
+    проверяется здесь же, до аутентификации DRF. В ответ добавляется
+    X-Profile-Id с путём к сохранённому профилю.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self.get_mode(request)
+        if mode is None or not _busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, memory=(mode == 'memory'))
+        finally:
+            _busy.release()
+
+    def get_mode(self, request):
+        header = request.META.get('HTTP_X_PROFILE')
+        if header and self.is_staff(request):
+            return header.strip().lower()
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return 'cpu'
+        return None
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            result = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return result is not None and result[0].is_staff
+
+    def profile(self, request, memory):
+        profiler = cProfile.Profile()
+        if memory:
+            tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot() if memory else None
+            if memory:
+                tracemalloc.stop()
+        elapsed = (time.perf_counter() - started) * 1000
+
+        directory = os.path.join(settings.PROFILING_DIR, view_name(request))
+        os.makedirs(directory, exist_ok=True)
+        name = (f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-'
+                f'{uuid.uuid4().hex[:6]}-{int(elapsed)}ms')
+        path = os.path.join(directory, name)
+        profiler.dump_stats(path + PROFILE_SUFFIX)
+        if snapshot is not None:
+            snapshot.dump(path + MEMORY_SUFFIX)
+        response['X-Profile-Id'] = os.path.relpath(
+            path, settings.PROFILING_DIR)
+        return response
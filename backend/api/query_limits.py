@@ -0,0 +1,72 @@
+"""Ограничения на запросы к базе для отдельных action.
+
+Вьюсет объявляет их словарём query_limits: action -> QueryLimit.
+timeout - statement_timeout PostgreSQL в миллисекундах,
+queries - сколько SQL-запросов action может выполнить.
+"""
+import logging
+from collections import namedtuple
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger('api.query_limits')
+
+QueryLimit = namedtuple('QueryLimit', ('timeout', 'queries'),
+                        defaults=(None, None))
+
+QUERY_CANCELED = '57014'
+
+
+class QueryTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Запрос к базе выполнялся слишком долго.'
+    default_code = 'query_timeout'
+
+
+class TooManyQueries(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = ('Запрос требует слишком много обращений к базе, '
+                      'уменьшите размер страницы или выборки.')
+    default_code = 'too_many_queries'
+
+
+def is_query_canceled(exc):
+    """Ошибка Django, за которой стоит отмена по statement_timeout."""
+    cause = getattr(exc, '__cause__', None)
+    return getattr(cause, 'pgcode', None) == QUERY_CANCELED
+
+
+class QueryGuard:
+    """
+    execute_wrapper для всех соединений на время запроса: перед первым
+    запросом к PostgreSQL выставляет statement_timeout, считает запросы
+    и прерывает action, если их больше лимита.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.connections = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        if (self.limit.timeout and connection.vendor == 'postgresql'
+                and connection.alias not in self.connections):
+            # Курсор драйвера, а не обёртка Django: через неё запрос
+            # снова прошёл бы через этот же execute_wrapper.
+            context['cursor'].cursor.execute('SET statement_timeout = %s',
+                                             (self.limit.timeout,))
+            self.connections[connection.alias] = connection
+        self.count += 1
+        if self.limit.queries and self.count > self.limit.queries:
+            raise TooManyQueries()
+        return execute(sql, params, many, context)
+
+    def reset(self):
+        """Соединение переиспользуется, поэтому таймаут снимается."""
+        for connection in self.connections.values():
+            if connection.connection is None or connection.needs_rollback:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('RESET statement_timeout')
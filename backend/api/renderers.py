@@ -0,0 +1,62 @@
+"""JSON-рендерер на orjson с откатом на стандартный json."""
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Тот же вывод, что у JSONRenderer, но кодирование через orjson.
+    Даты, Decimal, ленивые строки и прочие нестандартные типы
+    кодируются так же, как в DRF, через JSONEncoder.default.
+    Отступы и всё, что orjson не умеет, уходят в стандартный рендерер.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default,
+                               option=OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк для JavaScript.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028')
+            ret = ret.replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class PDFRenderer(BaseRenderer):
+    """
+    Нужен для согласования формата ?format=pdf: само действие
+    возвращает готовый файл. Через рендерер проходят только ошибки
+    (401, 429, 503), их он отдаёт в JSON.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if isinstance(data, bytes) and (
+                response is None or response.status_code < 400):
+            return data
+        fallback = FastJSONRenderer()
+        if response is not None:
+            response['Content-Type'] = fallback.media_type
+        return fallback.render(data, fallback.media_type, renderer_context)
@@ -1,17 +1,39 @@
+import json
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from djoser.serializers import UserCreateSerializer, UserSerializer
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from djoser.serializers import (CurrentPasswordSerializer,
+                                UidAndTokenSerializer, UserCreateSerializer,
+                                UserSerializer)
 from drf_extra_fields.fields import Base64ImageField
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import Ingredient, IngredientVolume, Recipe, Tag
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientVolume,
+                            Recipe, ShoppingCard, Tag)
+from recipes.registry import registry
+from recipes.similarity import update_similar
+from recipes.snapshot import build_snapshots, unpack_snapshot
 from users.models import Follow
 
+from api.uploads import RecipeImageField
+
 User = get_user_model()
 
 
+def get_registry(serializer):
+    """
+    Справочник один на всю сериализацию: CacheVersion.get() ходит
+    в кеш, и без этого было бы по обращению на поле каждой записи.
+    Вложенные сериализаторы делят context с корневым.
+    """
+    context = serializer.context
+    if 'registry' not in context:
+        context['registry'] = registry.get()
+    return context['registry']
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     last_name = serializers.CharField(required=True)
     first_name = serializers.CharField(required=True)
@@ -40,6 +62,34 @@ class CustomUserSerializer(UserSerializer):
         return Follow.objects.filter(user=user, author=obj.id).exists()
 
 
+class NewUsernameSerializer(serializers.ModelSerializer):
+    """
+    Новое имя пользователя. Вьюхи djoser читают поле
+    new_<USERNAME_FIELD>, а их сериализаторы называют его по
+    LOGIN_FIELD (у нас email), и смена имени падала с KeyError.
+    """
+
+    class Meta:
+        model = User
+        fields = (User.USERNAME_FIELD,)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields[f'new_{User.USERNAME_FIELD}'] = self.fields.pop(
+            User.USERNAME_FIELD)
+
+
+class SetUsernameSerializer(NewUsernameSerializer, CurrentPasswordSerializer):
+    class Meta:
+        model = User
+        fields = (User.USERNAME_FIELD, 'current_password')
+
+
+class UsernameResetConfirmSerializer(UidAndTokenSerializer,
+                                     NewUsernameSerializer):
+    pass
+
+
 class ShowShortRecipesSerializer(serializers.ModelSerializer):
     """Укороченная версия рецепта."""
     image = Base64ImageField()
@@ -74,11 +124,16 @@ class FollowSerializer(serializers.ModelSerializer):
         return True
 
     def get_recipes(self, obj):
-        author_recipes = Recipe.objects.filter(author=obj.author)
+        # Список подписок заранее подгружает рецепты через
+        # prefetch_related('author__recipies').
+        author_recipes = obj.author.recipies.all()
         return ShowShortRecipesSerializer(author_recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        count = getattr(obj, 'recipes_count', None)
+        if count is None:
+            count = Recipe.objects.filter(author=obj.author).count()
+        return count
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -127,22 +182,29 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientForRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.ReadOnlyField(source='ingredient.id')
-    name = serializers.CharField(source='ingredient.name', read_only=True)
-    measurement_unit = serializers.CharField(
-        source='ingredient.measurement_unit', read_only=True)
+    """Название и единица берутся из справочника, без JOIN."""
+    id = serializers.ReadOnlyField(source='ingredient_id')
+    name = serializers.SerializerMethodField()
+    measurement_unit = serializers.SerializerMethodField()
 
     class Meta:
         model = IngredientVolume
         fields = ('id', 'name', 'amount', 'measurement_unit',)
 
+    def get_name(self, obj):
+        return get_registry(self).ingredient(obj.ingredient_id).name
+
+    def get_measurement_unit(self, obj):
+        return get_registry(self).ingredient(
+            obj.ingredient_id).measurement_unit
+
 
 class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientForRecipeSerializer(source='ingredientvolume_set',
                                                 many=True, read_only=True)
-    tags = TagSerializer(read_only=True, many=True)
+    tags = serializers.SerializerMethodField(method_name='get_tags')
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     is_favorited = serializers.SerializerMethodField(
         method_name='get_is_favorited')
     is_in_shopping_cart = serializers.SerializerMethodField(
@@ -155,14 +217,19 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'name', 'image', 'text', 'cooking_time',)
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = self.get_initial_list('ingredients')
         if not ingredients:
             raise serializers.ValidationError('Нужен хотя бы один '
                                               'ингредиент для рецепта')
+        known = get_registry(self)
         ingredient_list = []
         for item in ingredients:
-            ingredient = get_object_or_404(Ingredient,
-                                           id=item['id'])
+            try:
+                ingredient = known.ingredient(int(item['id']))
+            except (TypeError, ValueError):
+                ingredient = None
+            if ingredient is None:
+                raise exceptions.NotFound()
             if ingredient in ingredient_list:
                 raise serializers.ValidationError('Ингредиенты должны '
                                                   'быть уникальными')
@@ -173,6 +240,27 @@ class RecipeSerializer(serializers.ModelSerializer):
         data['ingredients'] = ingredients
         return data
 
+    def get_initial_list(self, name):
+        """
+        Список из исходных данных. В JSON он приходит списком,
+        в multipart - повторяющимися полями или строкой JSON.
+        """
+        if not hasattr(self.initial_data, 'getlist'):
+            return self.initial_data.get(name)
+        items = []
+        for value in self.initial_data.getlist(name):
+            if value.strip()[:1] in ('[', '{'):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise serializers.ValidationError(
+                        {name: 'Некорректный JSON'})
+            if isinstance(value, list):
+                items.extend(value)
+            else:
+                items.append(value)
+        return items
+
     def validate_cooking_time(self, value):
         if value < settings.COOKING_TIME:
             raise serializers.ValidationError({
@@ -181,6 +269,12 @@ class RecipeSerializer(serializers.ModelSerializer):
             })
         return value
 
+    def get_tags(self, obj):
+        known = get_registry(self)
+        tag_ids = Recipe.tags.through.objects.filter(
+            recipe_id=obj.id).order_by('id').values_list('tag_id', flat=True)
+        return [known.tag(tag_id).as_dict() for tag_id in tag_ids]
+
     def get_is_favorited(self, obj):
         user = self.context.get('request').user
         if user.is_anonymous:
@@ -202,20 +296,99 @@ class RecipeSerializer(serializers.ModelSerializer):
                 amount=ingredient.get('amount'),
             )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
-        tags = self.initial_data.get('tags')
+        tags = self.get_initial_list('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        update_similar(recipe)
+        # Модуль SSE нужен воркеру WSGI только здесь, не при запуске.
+        from api.live import notify_new_recipe
+        notify_new_recipe(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        tags = self.initial_data.get('tags')
+        tags = self.get_initial_list('tags')
+        old_image = instance.image.name
         recipe_update = super().update(instance, validated_data)
         IngredientVolume.objects.filter(recipe=instance).all().delete()
         recipe_update.tags.set(tags)
         self.create_ingredients(ingredients, recipe_update)
         recipe_update.save()
+        if recipe_update.image.name != old_image:
+            Recipe.release_image(old_image)
+        update_similar(recipe_update)
         return recipe_update
+
+
+class RecipeReadSerializer:
+    """
+    Быстрое представление рецептов только для чтения.
+    Выдаёт то же, что RecipeSerializer, но берёт теги, ингредиенты
+    и автора из снимка Recipe.snapshot и добавляет к ним только
+    флаги текущего пользователя, без объектов Field на каждое поле.
+    """
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @property
+    def data(self):
+        recipes = list(self.instance) if self.many else [self.instance]
+        data = self.to_representation(recipes)
+        return data if self.many else data[0]
+
+    def to_representation(self, recipes):
+        ids = [recipe.id for recipe in recipes]
+        author_ids = {recipe.author_id for recipe in recipes}
+        request = self.context.get('request')
+        user = request.user if request else None
+
+        snapshots = {recipe.id: recipe.snapshot for recipe in recipes
+                     if recipe.snapshot}
+        missing = [recipe for recipe in recipes if recipe.id not in snapshots]
+        if missing:
+            snapshots.update(build_snapshots(missing))
+
+        favorited = in_cart = subscribed = frozenset()
+        if user is not None and not user.is_anonymous:
+            favorited = set(FavoriteRecipe.objects.filter(
+                user=user, recipe_id__in=ids).values_list(
+                    'recipe_id', flat=True))
+            in_cart = set(ShoppingCard.objects.filter(
+                user=user, recipe_id__in=ids).values_list(
+                    'recipe_id', flat=True))
+            subscribed = set(Follow.objects.filter(
+                user=user, author_id__in=author_ids).exclude(
+                    author=user).values_list('author_id', flat=True))
+
+        storage = Recipe._meta.get_field('image').storage
+        data = []
+        for recipe in recipes:
+            image = None
+            if recipe.image:
+                image = storage.url(recipe.image.name)
+                if request is not None:
+                    image = request.build_absolute_uri(image)
+            snapshot = unpack_snapshot(snapshots[recipe.id])
+            snapshot['author']['is_subscribed'] = (
+                recipe.author_id in subscribed)
+            data.append({
+                'id': recipe.id,
+                'tags': snapshot['tags'],
+                'author': snapshot['author'],
+                'ingredients': snapshot['ingredients'],
+                'is_favorited': recipe.id in favorited,
+                'is_in_shopping_cart': recipe.id in in_cart,
+                'name': recipe.name,
+                'image': image,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            })
+        return data
@@ -0,0 +1,155 @@
+"""Список покупок в PDF.
+
+Вёрстка PDF занимает процессор, поэтому выполняется в отдельном
+пуле процессов, а число ожидающих задач ограничено. Готовый файл
+сохраняется под хешем содержимого корзины: повторная выгрузка
+неизменной корзины сводится к чтению файла. Файлы старше
+PDF_CACHE_MAX_AGE и самые давние сверх PDF_CACHE_MAX_FILES
+удаляются не чаще раза в PDF_CACHE_EVICT_INTERVAL секунд.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Меняется вместе с вёрсткой, чтобы не отдавать старые файлы.
+LAYOUT_VERSION = 1
+TITLE = 'Мой список покупок'
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_evicted_at = None
+
+
+class RenderUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервис PDF перегружен, повторите попытку позже.'
+    default_code = 'pdf_unavailable'
+
+
+def render_pdf(items, font_path):
+    """Выполняется в дочернем процессе: items -> байты PDF."""
+    from io import BytesIO
+
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    pdfmetrics.registerFont(TTFont('ShoppingList', font_path))
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    top = height - 20 * mm
+    y = top
+    pdf.setFont('ShoppingList', 16)
+    pdf.drawString(20 * mm, y, TITLE)
+    y -= 12 * mm
+    pdf.setFont('ShoppingList', 12)
+    for number, (name, unit, total) in enumerate(items, start=1):
+        if y < 20 * mm:
+            pdf.showPage()
+            pdf.setFont('ShoppingList', 12)
+            y = top
+        pdf.drawString(20 * mm, y, f'{number}. {name}')
+        pdf.drawRightString(width - 20 * mm, y, f'{total} {unit}')
+        y -= 8 * mm
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _pool():
+    """
+    Пул создаётся лениво, уже после fork воркера gunicorn;
+    multiprocessing импортируется тогда же, а не при запуске.
+    """
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(settings.PDF_MAX_PENDING)
+    return _executor, _slots
+
+
+def cache_path(items):
+    payload = json.dumps([LAYOUT_VERSION, items], ensure_ascii=False)
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    return os.path.join(settings.PDF_CACHE_DIR, digest[:2], f'{digest}.pdf')
+
+
+def evict_cache():
+    """Чистит PDF_CACHE_DIR; время обращения - mtime файла."""
+    files = []
+    for directory in os.scandir(settings.PDF_CACHE_DIR):
+        if not directory.is_dir(follow_symlinks=False):
+            continue
+        with os.scandir(directory.path) as entries:
+            files.extend((entry.stat().st_mtime, entry.path)
+                         for entry in entries
+                         if entry.is_file(follow_symlinks=False))
+    deadline = time.time() - settings.PDF_CACHE_MAX_AGE
+    files.sort(reverse=True)
+    for number, (mtime, path) in enumerate(files):
+        if number >= settings.PDF_CACHE_MAX_FILES or mtime < deadline:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def maybe_evict_cache():
+    global _evicted_at
+    with _lock:
+        now = time.monotonic()
+        if (_evicted_at is not None and now - _evicted_at
+                < settings.PDF_CACHE_EVICT_INTERVAL):
+            return
+        _evicted_at = now
+    evict_cache()
+
+
+def get_shopping_pdf(items):
+    """
+    Путь к PDF для списка покупок; рендерит файл, если его нет.
+    Если очередь пула заполнена или рендер не уложился
+    в PDF_RENDER_TIMEOUT, поднимает RenderUnavailable.
+    """
+    path = cache_path(items)
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise RenderUnavailable()
+    future = executor.submit(render_pdf, items, settings.PDF_FONT_PATH)
+    # Слот освобождается, когда задача действительно завершилась,
+    # даже если клиент уже получил отказ по таймауту.
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        content = future.result(timeout=settings.PDF_RENDER_TIMEOUT)
+    except FutureTimeout:
+        raise RenderUnavailable()
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(content)
+    os.replace(tmp, path)
+    maybe_evict_cache()
+    return path
@@ -0,0 +1,59 @@
+"""Сброс закешированных ответов API и метки рецептов для ETag
+при изменении рецептов, справочников и авторов."""
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientVolume, Recipe, Tag
+from recipes.signals import snapshots_refreshed
+from recipes.snapshot import AUTHOR_FIELDS
+
+from api.cache import invalidate_api_cache
+from api.functions import touch_recipes_state
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def directory_changed(sender, **kwargs):
+    invalidate_api_cache()
+    touch_recipes_state()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientVolume)
+@receiver(post_delete, sender=IngredientVolume)
+def recipe_changed(sender, **kwargs):
+    """Правки из админки и напрямую через модели тоже в счёт."""
+    invalidate_api_cache()
+    touch_recipes_state()
+
+
+@receiver(snapshots_refreshed)
+def snapshots_changed(sender, **kwargs):
+    """Снимки могут переписываться в фоне, уже после коммита правки."""
+    invalidate_api_cache()
+    touch_recipes_state()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_api_cache()
+        touch_recipes_state()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def author_changed(sender, instance, created=False, update_fields=None,
+                   **kwargs):
+    """Вход в админку обновляет только last_login, это не в счёт."""
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    invalidate_api_cache()
+    touch_recipes_state()
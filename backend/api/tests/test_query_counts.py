@@ -0,0 +1,353 @@
+"""Число SQL-запросов для каждого маршрута api.urls.
+
+Запросы, которые зависят от СУБД, а не от кода (SET/RESET
+statement_timeout и точки сохранения), не считаются, поэтому
+одни и те же числа верны и для PostgreSQL в CI, и для SQLite.
+Работа после коммита (снимки рецептов, индекс ингредиентов)
+выполняется отдельно от подсчёта.
+"""
+import base64
+import io
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from djoser.utils import encode_uid
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientVolume,
+                            Recipe, ShoppingCard, Tag)
+from recipes.registry import registry
+from recipes.snapshot import refresh_snapshots
+from users.models import Follow
+
+User = get_user_model()
+
+PASSWORD = 'Tests-password-1'
+IGNORED = re.compile(
+    r'^\s*(SET |RESET |SAVEPOINT |RELEASE SAVEPOINT |ROLLBACK TO SAVEPOINT )',
+    re.IGNORECASE)
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+def image_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 40, 40)).save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryCountTestCase(APITestCase):
+    """Общие данные: автор с рецептами, читатель и третий пользователь."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            'author', 'author@test.local', PASSWORD,
+            first_name='Имя', last_name='Автор')
+        cls.viewer = User.objects.create_user(
+            'viewer', 'viewer@test.local', PASSWORD,
+            first_name='Имя', last_name='Читатель')
+        cls.other = User.objects.create_user(
+            'other', 'other@test.local', PASSWORD,
+            first_name='Имя', last_name='Другой')
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', color=Tag.RED,
+                               slug='breakfast'),
+            Tag.objects.create(name='Обед', color=Tag.GREEN, slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)
+        ]
+        cls.recipes = []
+        for number in range(6):
+            recipe = Recipe.objects.create(
+                author=cls.author if number % 2 else cls.other,
+                name=f'рецепт {number}', image=f'recipes/{number}.png',
+                text='Описание', cooking_time=10 + number)
+            recipe.tags.set(cls.tags[:1 + number % 2])
+            IngredientVolume.objects.bulk_create(
+                IngredientVolume(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in cls.ingredients[number % 3:number % 3 + 3])
+            cls.recipes.append(recipe)
+        refresh_snapshots(Recipe.objects.all())
+        Follow.objects.create(user=cls.viewer, author=cls.author)
+        FavoriteRecipe.objects.create(user=cls.viewer, recipe=cls.recipes[1])
+        ShoppingCard.objects.create(user=cls.viewer, recipe=cls.recipes[1])
+        ShoppingCard.objects.create(user=cls.viewer, recipe=cls.recipes[2])
+        cls.recipe = cls.recipes[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Кеш общий для тестов: ответы, ведра throttling, справочник.
+        cache.clear()
+        registry.get()
+        ingredient_index.get()
+        self.login(self.viewer)
+
+    def login(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    @contextmanager
+    def assert_queries(self, expected):
+        """assertNumQueries без запросов, зависящих от СУБД."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as context:
+                yield
+        queries = [query['sql'] for query in context.captured_queries
+                   if not IGNORED.match(query['sql'])]
+        self.assertEqual(
+            len(queries), expected,
+            f'{len(queries)} запросов вместо {expected}:\n'
+            + '\n'.join(queries))
+        for callback in callbacks:
+            callback()
+
+    def request(self, method, url, queries, status, data=None):
+        with self.assert_queries(queries):
+            response = getattr(self.client, method)(url, data,
+                                                    format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+
+class RoutesCoverageTest(QueryCountTestCase):
+    """Новый маршрут в api.urls должен получить тест ниже."""
+
+    def test_every_route_is_covered(self):
+        covered = {
+            'subscribe', 'subscriptions', 'api-root', 'login', 'logout',
+            'api_tags-list', 'api_tags-detail',
+            'api_ingredients-list', 'api_ingredients-detail',
+            'api_recipes-list', 'api_recipes-detail', 'api_recipes-batch',
+            'api_recipes-download-shopping-cart', 'api_recipes-feed',
+            'api_recipes-trending', 'api_recipes-what-to-cook',
+            'api_recipes-favorite', 'api_recipes-shopping-cart',
+            'api_recipes-similar',
+            'user-list', 'user-detail', 'user-me', 'user-activation',
+            'user-resend-activation', 'user-reset-password',
+            'user-reset-password-confirm', 'user-reset-username',
+            'user-reset-username-confirm', 'user-set-password',
+            'user-set-username',
+        }
+        names = set(route_names(get_resolver('api.urls').url_patterns))
+        self.assertEqual(names, covered)
+
+
+class DirectoryRoutesTest(QueryCountTestCase):
+
+    def test_api_root(self):
+        self.request('get', reverse('api:api-root'), 1, 200)
+
+    def test_tags(self):
+        self.request('get', reverse('api:api_tags-list'), 2, 200)
+        self.request('get', reverse('api:api_tags-detail',
+                                    args=(self.tags[0].id,)), 2, 200)
+
+    def test_ingredients(self):
+        self.request('get', reverse('api:api_ingredients-list')
+                     + '?name=ингр', 2, 200)
+        self.request('get', reverse('api:api_ingredients-detail',
+                                    args=(self.ingredients[0].id,)), 2, 200)
+
+
+class RecipeReadRoutesTest(QueryCountTestCase):
+
+    def test_list(self):
+        self.request('get', reverse('api:api_recipes-list'), 6, 200)
+
+    def test_list_anonymous(self):
+        self.client.credentials()
+        self.request('get', reverse('api:api_recipes-list'), 2, 200)
+
+    def test_detail(self):
+        self.request('get', reverse('api:api_recipes-detail',
+                                    args=(self.recipe.id,)), 8, 200)
+
+    def test_batch(self):
+        ids = ','.join(str(recipe.id) for recipe in self.recipes)
+        self.request('get', reverse('api:api_recipes-batch')
+                     + f'?ids={ids}', 5, 200)
+
+    def test_feed(self):
+        self.request('get', reverse('api:api_recipes-feed'), 5, 200)
+
+    def test_trending(self):
+        self.request('get', reverse('api:api_recipes-trending'), 2, 200)
+
+    def test_what_to_cook(self):
+        ids = ','.join(str(item.id) for item in self.ingredients[:3])
+        self.request('get', reverse('api:api_recipes-what-to-cook')
+                     + f'?ingredients={ids}&limit=20', 5, 200)
+
+    def test_similar(self):
+        self.request('get', reverse('api:api_recipes-similar',
+                                    args=(self.recipe.id,)), 3, 200)
+
+    def test_download_shopping_cart(self):
+        self.request('get', reverse('api:api_recipes-download-shopping-cart'),
+                     2, 200)
+
+
+class RecipeWriteRoutesTest(QueryCountTestCase):
+
+    def recipe_data(self, ingredients=3):
+        return {
+            'name': 'Новый рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [{'id': item.id, 'amount': 5}
+                            for item in self.ingredients[:ingredients]],
+            'image': image_base64(),
+        }
+
+    def test_create(self):
+        self.request('post', reverse('api:api_recipes-list'), 25, 201,
+                     self.recipe_data())
+
+    def test_update(self):
+        self.login(self.author)
+        url = reverse('api:api_recipes-detail', args=(self.recipe.id,))
+        self.request('put', url, 26, 200, self.recipe_data())
+        data = self.recipe_data(ingredients=2)
+        del data['image']
+        self.request('patch', url, 24, 200, data)
+
+    def test_delete(self):
+        self.login(self.author)
+        self.request('delete', reverse('api:api_recipes-detail',
+                                       args=(self.recipe.id,)), 11, 204)
+
+    def test_favorite(self):
+        url = reverse('api:api_recipes-favorite', args=(self.recipes[3].id,))
+        self.request('post', url, 4, 201)
+        self.request('delete', url, 3, 204)
+
+    def test_shopping_cart(self):
+        url = reverse('api:api_recipes-shopping-cart',
+                      args=(self.recipes[3].id,))
+        self.request('post', url, 4, 201)
+        self.request('delete', url, 3, 204)
+
+
+class SubscriptionRoutesTest(QueryCountTestCase):
+
+    def test_subscriptions(self):
+        Follow.objects.create(user=self.viewer, author=self.other)
+        self.request('get', reverse('api:subscriptions') + '?limit=30',
+                     4, 200)
+
+    def test_subscribe_and_unsubscribe(self):
+        url = reverse('api:subscribe', args=(self.other.id,))
+        self.request('post', url, 7, 201)
+        self.request('delete', url, 4, 204)
+
+
+class UserRoutesTest(QueryCountTestCase):
+
+    def test_list(self):
+        self.request('get', reverse('api:user-list'), 2, 200)
+
+    def test_create(self):
+        self.client.credentials()
+        self.request('post', reverse('api:user-list'), 2, 201, {
+            'email': 'new@test.local', 'username': 'new',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': PASSWORD})
+
+    def test_detail(self):
+        url = reverse('api:user-detail', args=(self.viewer.id,))
+        self.request('get', url, 2, 200)
+        self.request('patch', url, 4, 200, {'first_name': 'Новое'})
+        self.request('put', url, 5, 200, {
+            'email': 'viewer@test.local', 'username': 'viewer',
+            'first_name': 'Имя', 'last_name': 'Читатель'})
+        self.request('delete', url, 12, 204,
+                     {'current_password': PASSWORD})
+
+    def test_me(self):
+        url = reverse('api:user-me')
+        self.request('get', url, 1, 200)
+        self.request('patch', url, 3, 200, {'last_name': 'Новая'})
+        self.request('put', url, 4, 200, {
+            'email': 'viewer@test.local', 'username': 'viewer',
+            'first_name': 'Имя', 'last_name': 'Читатель'})
+        self.request('delete', url, 11, 204,
+                     {'current_password': PASSWORD})
+
+    def test_set_password(self):
+        self.request('post', reverse('api:user-set-password'), 3, 204, {
+            'current_password': PASSWORD,
+            'new_password': 'Another-password-2'})
+
+    def test_set_username(self):
+        self.request('post', reverse('api:user-set-username'), 4, 204, {
+            'current_password': PASSWORD, 'new_username': 'renamed'})
+
+    def test_reset_password(self):
+        self.client.credentials()
+        self.request('post', reverse('api:user-reset-password'), 1, 204,
+                     {'email': self.viewer.email})
+        self.request('post', reverse('api:user-reset-password-confirm'),
+                     3, 204, {
+                         'uid': encode_uid(self.viewer.pk),
+                         'token': default_token_generator.make_token(
+                             self.viewer),
+                         'new_password': 'Another-password-2'})
+
+    def test_reset_username(self):
+        self.client.credentials()
+        self.request('post', reverse('api:user-reset-username'), 1, 204,
+                     {'email': self.viewer.email})
+        self.request('post', reverse('api:user-reset-username-confirm'),
+                     4, 204, {
+                         'uid': encode_uid(self.viewer.pk),
+                         'token': default_token_generator.make_token(
+                             self.viewer),
+                         'new_username': 'renamed'})
+
+    def test_activation(self):
+        self.client.credentials()
+        self.request('post', reverse('api:user-activation'), 1, 403, {
+            'uid': encode_uid(self.viewer.pk),
+            'token': default_token_generator.make_token(self.viewer)})
+        self.request('post', reverse('api:user-resend-activation'), 1, 400,
+                     {'email': self.viewer.email})
+
+
+class TokenRoutesTest(QueryCountTestCase):
+
+    def test_login_and_logout(self):
+        self.client.credentials()
+        response = self.request('post', reverse('api:login'), 3, 200, {
+            'email': self.viewer.email, 'password': PASSWORD})
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}')
+        self.request('post', reverse('api:logout'), 2, 204)
@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+
+class ActionTokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket на пользователя (для анонимов - на IP) и scope.
+    Scope берётся из словаря throttle_scopes вьюсета по action,
+    ставка вида '10/min' из DEFAULT_THROTTLE_RATES: ведро на
+    10 запросов, которое равномерно наполняется за минуту.
+    У авторизованных есть ещё общее ведро на IP, больше в
+    THROTTLE_IP_FACTOR раз: несколько аккаунтов с одного адреса
+    не получают по полной ставке каждый.
+    Персонал не ограничивается.
+    """
+    cache = cache
+    parse_rate = SimpleRateThrottle.parse_rate
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None))
+
+    def get_buckets(self, request, scope, capacity):
+        """Пары (ключ, ёмкость); запрос проходит, если есть токен в каждом."""
+        ident = self.get_ident(request)
+        if not request.user.is_authenticated:
+            return [(f'throttle:{scope}:ip:{ident}', capacity)]
+        return [
+            (f'throttle:{scope}:user:{request.user.pk}', capacity),
+            (f'throttle:{scope}:users_ip:{ident}',
+             capacity * settings.THROTTLE_IP_FACTOR),
+        ]
+
+    @contextmanager
+    def lock(self, keys):
+        """
+        Блокировка через cache.add: он атомарен и в LocMem, и в Redis,
+        и параллельные запросы не читают одно и то же состояние ведра.
+        """
+        locks = []
+        deadline = time.monotonic() + settings.THROTTLE_LOCK_WAIT
+        try:
+            for key in keys:
+                while not self.cache.add(f'{key}:lock', 1,
+                                         settings.THROTTLE_LOCK_TIMEOUT):
+                    if time.monotonic() > deadline:
+                        yield False
+                        return
+                    time.sleep(0.005)
+                locks.append(f'{key}:lock')
+            yield True
+        finally:
+            self.cache.delete_many(locks)
+
+    def allow_request(self, request, view):
+        if request.user.is_staff:
+            return True
+        scope = self.get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if scope is None or rate is None:
+            return True
+        capacity, period = self.parse_rate(rate)
+        buckets = self.get_buckets(request, scope, capacity)
+        with self.lock([key for key, _ in buckets]) as locked:
+            if not locked:
+                self.wait_time = period / capacity
+                return False
+            now = time.time()
+            states = self.cache.get_many([key for key, _ in buckets])
+            tokens = {}
+            for key, size in buckets:
+                left, stamp = states.get(key, (size, now))
+                tokens[key] = min(size, left + (now - stamp) * size / period)
+            waits = [(1 - left) * period / size
+                     for (key, size), left in zip(buckets, tokens.values())
+                     if left < 1]
+            allowed = not waits
+            if allowed:
+                tokens = {key: left - 1 for key, left in tokens.items()}
+            else:
+                self.wait_time = max(waits)
+            self.cache.set_many(
+                {key: (left, now) for key, left in tokens.items()}, period)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
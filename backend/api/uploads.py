@@ -0,0 +1,100 @@
+"""Загрузка изображений рецептов: base64 в JSON и multipart.
+
+Файлы из multipart больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся
+во временный файл на диске, а не держатся в памяти. Размер
+проверяется по мере чтения тела запроса, размеры картинки - по
+заголовку файла, до того как Django целиком проверит изображение.
+"""
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+
+class UploadTooLarge(RequestDataTooBig, APIException):
+    """
+    Обработчик загрузки общий для всего сайта. В представлениях DRF
+    это APIException и ответ 413, в остальных, например в админке,
+    Django обрабатывает RequestDataTooBig как SuspiciousOperation
+    и отвечает 400, а не 500.
+    """
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой.'
+    default_code = 'upload_too_large'
+
+
+def too_large_message():
+    limit = settings.RECIPE_IMAGE_MAX_SIZE // 1024 // 1024
+    return f'Размер изображения не должен превышать {limit} МБ.'
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """
+    Первый обработчик в FILE_UPLOAD_HANDLERS: обрывает разбор,
+    как только файл превысил RECIPE_IMAGE_MAX_SIZE, не дочитывая
+    остаток тела. Данные передаёт следующим обработчикам без изменений.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # Запас на остальные поля формы и разделители multipart.
+        if content_length > settings.RECIPE_IMAGE_MAX_SIZE * 2:
+            raise UploadTooLarge(too_large_message())
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise UploadTooLarge(too_large_message())
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Изображение рецепта строкой base64, как раньше, или файлом
+    из multipart. Длина base64 проверяется до декодирования,
+    ширина и высота - по заголовку, без декодирования пикселей.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            encoded = data.partition(';base64,')[2] or data
+            if len(encoded) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise serializers.ValidationError(too_large_message())
+            image = super().to_internal_value(data)
+        elif isinstance(data, UploadedFile):
+            if data.size > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise serializers.ValidationError(too_large_message())
+            self.check_dimensions(data)
+            return serializers.ImageField.to_internal_value(self, data)
+        else:
+            image = super().to_internal_value(data)
+        if image is not None:
+            self.check_dimensions(image)
+        return image
+
+    def check_dimensions(self, file):
+        from PIL import Image
+
+        limit = settings.RECIPE_IMAGE_MAX_DIMENSION
+        try:
+            file.seek(0)
+            with Image.open(file) as image:
+                width, height = image.size
+        except (OSError, ValueError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            file.seek(0)
+        if width > limit or height > limit:
+            raise serializers.ValidationError(
+                f'Изображение должно быть не больше {limit}x{limit} '
+                'пикселей.')
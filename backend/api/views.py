@@ -1,31 +1,38 @@
 from django.conf import settings as set
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Count
+from django.http import FileResponse, HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientVolume,
-                            Recipe, ShoppingCard, Tag)
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCard,
+                            Tag)
 from users.models import Follow
 
 from api.filters import IngredientSearchFilter, RecipeFilterBackend
-from api.functions import del_obj, post_obj
-from api.mixins import ListCreateDeleteViewSet
-from api.pagination import LimitPageNumberPagination
+from api.functions import (del_obj, get_shopping_list, parse_ids, post_obj,
+                           touch_user_state)
+from api.mixins import (ConditionalGetMixin, ListCreateDeleteViewSet,
+                        QueryLimitMixin)
+from api.pagination import LimitPageNumberPagination, RecipeCursorPagination
 from api.permission import IsAuthorOrReadOnlyPermission
+from api.query_limits import QueryLimit
+from api.renderers import PDFRenderer
 from api.serializers import (FollowSerializer, IngredientSerializer,
-                             RecipeSerializer, SubscribeSerializer,
-                             TagSerializer)
+                             RecipeReadSerializer, RecipeSerializer,
+                             SubscribeSerializer, TagSerializer)
+from api.shopping_pdf import get_shopping_pdf
 
 User = get_user_model()
 
 
-class UserSubscribeViewSet(ListCreateDeleteViewSet):
+class UserSubscribeViewSet(QueryLimitMixin, ListCreateDeleteViewSet):
     """
     Реализация подписки/отписки на/от другого
     пользователя: эндпоинт users/<int:user_id>/subscribe/
@@ -35,13 +42,24 @@ class UserSubscribeViewSet(ListCreateDeleteViewSet):
     serializer_class = SubscribeSerializer
     pagination_class = LimitPageNumberPagination
     permission_classes = (IsAuthenticated,)
+    replica_actions = ('list',)
+    query_limits = {
+        'list': QueryLimit(timeout=2000, queries=60),
+        'create': QueryLimit(timeout=1000, queries=20),
+        'destroy': QueryLimit(timeout=1000, queries=20),
+    }
 
     def perform_create(self, serializer):
-        return serializer.save(user=self.request.user)
+        instance = serializer.save(user=self.request.user)
+        touch_user_state(self.request.user)
+        return instance
 
     def list(self, request):
         user = request.user
-        queryset = user.follower.filter(user=user)
+        queryset = user.follower.filter(user=user).select_related(
+            'author').annotate(
+                recipes_count=Count('author__recipies')).prefetch_related(
+                    'author__recipies').order_by('-id')
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(pages, many=True,
                                       context={'request': request})
@@ -63,6 +81,7 @@ class UserSubscribeViewSet(ListCreateDeleteViewSet):
             Follow, user=user, author=author
         )
         follow.delete()
+        touch_user_state(user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -75,9 +94,10 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
+    replica_actions = ('list', 'retrieve')
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(QueryLimitMixin, viewsets.ReadOnlyModelViewSet):
     """"
     Вывод списка ингредиентов.
     Ингредиенты может создавать только админ.
@@ -89,9 +109,16 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     filter_backends = (IngredientSearchFilter,)
     search_fields = ('^name',)
+    throttle_scopes = {'list': 'ingredient_search'}
+    replica_actions = ('list', 'retrieve')
+    query_limits = {
+        'list': QueryLimit(timeout=1000, queries=5),
+        'retrieve': QueryLimit(timeout=500, queries=5),
+    }
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(QueryLimitMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     """"
     Вывод списка рецептов/ отельного рецепта -
     доступно всем пользователям.
@@ -99,13 +126,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
     создание/редактирование/удаление рецепта,
     добавление/удаление рецепта в избранное,
     добавление/удаление рецепта в  список покупок,
-    получние текстового файла со списком покупок.
+    получние текстового файла со списком покупок,
+    лента рецептов авторов, на которых подписан пользователь,
+    похожие рецепты, подбор рецептов по имеющимся ингредиентам,
+    получение нескольких рецептов по списку id, популярные рецепты.
     """
     serializer_class = RecipeSerializer
     pagination_class = LimitPageNumberPagination
     permission_classes = (IsAuthorOrReadOnlyPermission,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilterBackend
+    read_only_actions = ('list', 'feed', 'similar', 'what_to_cook', 'batch',
+                         'trending')
+    replica_actions = ('list', 'retrieve', 'feed', 'similar', 'batch',
+                       'trending')
+    throttle_scopes = {
+        'create': 'recipe_write',
+        'update': 'recipe_write',
+        'partial_update': 'recipe_write',
+        'download_shopping_cart': 'shopping_cart',
+    }
+    # Запись не ограничена по числу запросов: оно растёт
+    # с числом ингредиентов рецепта.
+    query_limits = {
+        'list': QueryLimit(timeout=2000, queries=20),
+        'retrieve': QueryLimit(timeout=1000, queries=20),
+        'feed': QueryLimit(timeout=2000, queries=20),
+        'similar': QueryLimit(timeout=1000, queries=20),
+        'batch': QueryLimit(timeout=2000, queries=10),
+        'trending': QueryLimit(timeout=1000, queries=20),
+        'what_to_cook': QueryLimit(timeout=2000, queries=60),
+        'create': QueryLimit(timeout=5000),
+        'update': QueryLimit(timeout=5000),
+        'partial_update': QueryLimit(timeout=5000),
+        'download_shopping_cart': QueryLimit(timeout=3000, queries=5),
+    }
 
     def get_queryset(self):
         is_favorited = self.request.query_params.get('is_favorited')
@@ -118,9 +173,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Recipe.objects.filter(cart__user=self.request.user)
         return Recipe.objects.all()
 
+    def get_serializer_class(self):
+        if self.action in self.read_only_actions:
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        image = instance.image.name
+        instance.delete()
+        Recipe.release_image(image)
+
+    @action(methods=('get',), detail=False,
+            permission_classes=(IsAuthenticated,),
+            pagination_class=RecipeCursorPagination)
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок одним запросом
+        с подзапросом по Follow, курсорная пагинация по id.
+        """
+        authors = Follow.objects.filter(user=request.user).values('author')
+        queryset = self.filter_queryset(
+            Recipe.objects.filter(author__in=authors))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=True, pagination_class=None)
+    def similar(self, request, pk=None):
+        """Похожие рецепты из предрассчитанной таблицы соседей."""
+        recipe = get_object_or_404(Recipe, id=pk)
+        queryset = Recipe.objects.filter(
+            neighbour_of__recipe=recipe).order_by('-neighbour_of__score')
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(methods=('get',), detail=False)
+    def trending(self, request):
+        """
+        Популярные рецепты из таблицы RecipeTrend, которую
+        пересчитывает команда update_trending.
+        """
+        queryset = self.filter_queryset(Recipe.objects.filter(
+            trend__isnull=False).order_by('-trend__score', '-id'))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=False)
+    def what_to_cook(self, request):
+        """
+        Рецепты по имеющимся ингредиентам: ?ingredients=1,2,3.
+        Сначала рецепты, где найдено больше ингредиентов,
+        в ответе есть число найденных и недостающих.
+        """
+        ingredient_ids = parse_ids(request.query_params.get('ingredients'))
+        if (not ingredient_ids
+                or len(ingredient_ids) > set.WHAT_TO_COOK_MAX_INGREDIENTS):
+            return Response(
+                {'errors': 'Укажите от 1 до '
+                           f'{set.WHAT_TO_COOK_MAX_INGREDIENTS} id '
+                           'ингредиентов через запятую'},
+                status=status.HTTP_400_BAD_REQUEST)
+        results = ingredient_index.get().search(ingredient_ids)
+        page = self.paginate_queryset(results)
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        page = [item for item in page if item[0] in recipes]
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page], many=True).data
+        for item, (_, covered, missing) in zip(data, page):
+            item['covered_count'] = covered
+            item['missing_count'] = missing
+        return self.get_paginated_response(data)
+
+    @action(methods=('get',), detail=False, pagination_class=None)
+    def batch(self, request):
+        """
+        Несколько рецептов за один запрос: ?ids=3,1,2.
+        Порядок ответа совпадает с порядком id, не найденные id
+        перечислены в missing.
+        """
+        ids = parse_ids(request.query_params.get('ids'))
+        if ids:
+            ids = list(dict.fromkeys(ids))
+        if not ids or len(ids) > set.RECIPE_BATCH_LIMIT:
+            return Response(
+                {'errors': f'Укажите от 1 до {set.RECIPE_BATCH_LIMIT} id '
+                           'рецептов через запятую'},
+                status=status.HTTP_400_BAD_REQUEST)
+        recipes = Recipe.objects.in_bulk(ids)
+        found = [recipes[pk] for pk in ids if pk in recipes]
+        serializer = self.get_serializer(found, many=True)
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in recipes],
+        })
+
     @action(methods=('post', 'delete',), detail=True,
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk=None):
@@ -140,21 +291,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return None
 
     @action(methods=('get',), detail=False,
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(*api_settings.DEFAULT_RENDERER_CLASSES,
+                              PDFRenderer))
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = IngredientVolume.objects.filter(
-            recipe__cart__user=user).values(
-                'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                    total=Sum('amount'))
+        ingredients = get_shopping_list(request.user)
+        if request.accepted_renderer.format == 'pdf':
+            return FileResponse(open(get_shopping_pdf(ingredients), 'rb'),
+                                as_attachment=True,
+                                filename=set.PDF_FILENAME,
+                                content_type='application/pdf')
         my_shopping_list = 'Мой cписок покупок: \n'
-        for item in ingredients:
-            my_shopping_list += (
-                f'{item["ingredient__name"]}-'
-                f'{item["total"]} '
-                f'{item["ingredient__measurement_unit"]}\n'
-            )
+        for name, unit, total in ingredients:
+            my_shopping_list += f'{name}-{total} {unit}\n'
         content_type = 'text/plain'
         response = HttpResponse(
             my_shopping_list, content_type=content_type)
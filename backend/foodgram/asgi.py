@@ -0,0 +1,20 @@
+"""
+ASGI config for foodgram project.
+
+Serves the whole API like foodgram.wsgi and additionally the
+server-sent events stream of new recipes at LIVE_RECIPES_PATH,
+which needs long-lived connections. Run it with
+``uvicorn foodgram.asgi:application``.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+django_application = get_asgi_application()
+
+from api.live import with_live_recipes  # noqa: E402
+
+application = with_live_recipes(django_application)
@@ -0,0 +1,78 @@
+"""Маршрутизация чтений на реплики PostgreSQL.
+
+Реплики описываются в DB_REPLICAS, запросы идут на них только
+в запросе, для которого ReplicaRoutingMiddleware включил чтение
+с реплик. Недоступная реплика исключается на DB_REPLICA_RETRY секунд,
+а если живых реплик нет, чтение идёт в основную базу.
+"""
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+_down_until = {}
+
+
+class ReplicaState:
+    """
+    Состояние текущего запроса. Объект изменяемый: под ASGI
+    middleware и представление работают в разных копиях контекста,
+    но ссылаются на один и тот же объект.
+    """
+    __slots__ = ('enabled', 'used')
+
+    def __init__(self):
+        self.enabled = False
+        self.used = None
+
+
+replica_state = contextvars.ContextVar('replica_state', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES
+            if alias != DEFAULT_DB_ALIAS]
+
+
+def is_healthy(alias):
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        mark_down(alias)
+        return False
+    return True
+
+
+def mark_down(alias):
+    _down_until[alias] = time.monotonic() + settings.DB_REPLICA_RETRY
+    try:
+        connections[alias].close()
+    except DatabaseError:
+        pass
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+        if state is None or not state.enabled:
+            return None
+        aliases = replica_aliases()
+        for alias in random.sample(aliases, len(aliases)):
+            if is_healthy(alias):
+                state.used = alias
+                return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
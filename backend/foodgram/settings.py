@@ -34,10 +34,13 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'api.middleware.ApiCompressionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -72,6 +75,19 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICAS=host1:5432,host2:5432
+for number, address in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ('foodgram.db_router.ReplicaRouter',)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,6 +120,15 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', default=''),
+    }
+}
+
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
@@ -119,17 +144,41 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.ActionTokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'shopping_cart': os.environ.get('THROTTLE_SHOPPING_CART',
+                                        default='10/min'),
+        'ingredient_search': os.environ.get('THROTTLE_INGREDIENT_SEARCH',
+                                            default='120/min'),
+        'recipe_write': os.environ.get('THROTTLE_RECIPE_WRITE',
+                                       default='20/min'),
+    },
 }
 
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': 'False',
+    'PASSWORD_RESET_CONFIRM_URL': 'password/reset/confirm/{uid}/{token}',
+    'USERNAME_RESET_CONFIRM_URL': 'username/reset/confirm/{uid}/{token}',
     'SERIALIZERS': {
         'user_create': 'api.serializers.CustomUserCreateSerializer',
         'user': 'api.serializers.CustomUserSerializer',
         'current_user': 'api.serializers.CustomUserSerializer',
-
+        'set_username': 'api.serializers.SetUsernameSerializer',
+        'username_reset_confirm':
+            'api.serializers.UsernameResetConfirmSerializer',
     },
     'PERMISSIONS': {
         'user': ('rest_framework.permissions.IsAuthenticated',),
@@ -139,3 +188,62 @@ DJOSER = {
 COOKING_TIME = 1
 AMOUNT = 1
 FILENAME = 'my_shopping_list.txt'
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_CANDIDATES = 500
+SIMILAR_MAX_POSTING = 5000
+WHAT_TO_COOK_MAX_INGREDIENTS = 100
+WHAT_TO_COOK_MAX_RESULTS = 1000
+RECIPE_BATCH_LIMIT = 100
+INGREDIENT_INDEX_MAX_PATCH = 1000
+INGREDIENT_INDEX_MAX_PATCHED = 10000
+INGREDIENT_INDEX_LOG_TIMEOUT = 24 * 60 * 60
+SNAPSHOT_REFRESH_SYNC_LIMIT = 1000
+API_COMPRESSION_MIN_SIZE = 1024
+API_GZIP_LEVEL = 6
+API_BROTLI_QUALITY = 5
+API_CACHE_TIMEOUT = 60
+API_CACHED_PATHS = ('/api/tags/', '/api/ingredients/', '/api/recipes/')
+THROTTLE_IP_FACTOR = 5
+THROTTLE_LOCK_TIMEOUT = 1
+THROTTLE_LOCK_WAIT = 0.2
+DB_REPLICA_RETRY = 30
+DB_PRIMARY_STICKY_SECONDS = 10
+PDF_FILENAME = 'my_shopping_list.pdf'
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(BASE_DIR, 'pdf_cache'))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', 2))
+PDF_MAX_PENDING = int(os.getenv('PDF_MAX_PENDING', 8))
+PDF_RENDER_TIMEOUT = 10
+PDF_CACHE_MAX_FILES = int(os.getenv('PDF_CACHE_MAX_FILES', 10000))
+PDF_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+PDF_CACHE_EVICT_INTERVAL = 10 * 60
+STARTUP_BUDGET_MS = int(os.getenv('STARTUP_BUDGET_MS', 1500))
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TRACEMALLOC_FRAMES = 10
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 4096
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = (
+    'api.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+)
+CSV_EXPORT_CHUNK_SIZE = 2000
+MEDIA_QUARANTINE_DIR = os.getenv(
+    'MEDIA_QUARANTINE_DIR', os.path.join(BASE_DIR, 'media_quarantine'))
+MEDIA_GC_GRACE_HOURS = 24
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 0.5
+TRENDING_MIN_SCORE = 0.01
+TRENDING_LAG_SECONDS = 60
+LIVE_RECIPES_PATH = '/api/recipes/live/'
+LIVE_CHANNEL = 'foodgram_new_recipe'
+LIVE_MAX_CONNECTIONS = int(os.getenv('LIVE_MAX_CONNECTIONS', 5000))
+LIVE_QUEUE_SIZE = 32
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_SEND_TIMEOUT = 10
+LIVE_BACKLOG_LIMIT = 50
+LIVE_RECONNECT_SECONDS = 5
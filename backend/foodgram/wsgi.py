@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# URLconf со всеми представлениями и сериализаторами загружается сразу:
+# с gunicorn --preload это делается один раз в мастере до fork,
+# и первый запрос воркера не платит за импорт.
+get_resolver().url_patterns
@@ -0,0 +1,237 @@
+"""Инвертированный индекс «ингредиент → рецепты».
+
+Используется для подбора рецептов по имеющимся продуктам без
+GROUP BY по всей таблице IngredientVolume на каждый запрос.
+
+Индекс живёт в памяти процесса. Изменения рецептов записываются
+в журнал в общем кеше, и процесс при следующем обращении перечитывает
+из базы только изменённые рецепты. Целиком индекс пересобирается,
+только если журнал потерян или слишком отстал, и то в фоновом
+потоке: до замены запросы обслуживает прежний индекс.
+"""
+import heapq
+import logging
+import threading
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from recipes.models import IngredientVolume
+
+logger = logging.getLogger('recipes.ingredient_index')
+
+SEQ_KEY = 'ingredient_index_seq'
+CHANGE_KEY = 'ingredient_index_change:{}'
+# Запись журнала, после которой индекс собирается заново.
+REBUILD = 'rebuild'
+
+
+class IngredientIndex:
+    """
+    postings: id ингредиента -> array('I') с id рецептов;
+    sizes: array('H'), где по индексу id рецепта лежит
+    число его ингредиентов.
+    delta: (рецепты, изменённые после сборки, их актуальные
+    postings и число ингредиентов). Строки этих рецептов
+    в postings и sizes не учитываются.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(lambda: array('I'))
+        self.sizes = array('H')
+        self.delta = (frozenset(), {}, {})
+        self.seq = 0
+
+    @classmethod
+    def build(cls, chunk_size=10000):
+        index = cls()
+        rows = IngredientVolume.objects.order_by().values_list(
+            'ingredient_id', 'recipe_id').iterator(chunk_size=chunk_size)
+        for ingredient_id, recipe_id in rows:
+            index.postings[ingredient_id].append(recipe_id)
+            if recipe_id >= len(index.sizes):
+                size = max(recipe_id + 1, 2 * len(index.sizes))
+                index.sizes.extend(bytes(size - len(index.sizes)))
+            index.sizes[recipe_id] += 1
+        index.postings.default_factory = None
+        return index
+
+    def patch(self, recipe_ids):
+        """Перечитывает состав рецептов; удалённые просто исчезают."""
+        patched, extra, sizes = self.delta
+        extra = {
+            ingredient_id: recipes - recipe_ids
+            for ingredient_id, recipes in extra.items()
+        }
+        sizes = {**sizes, **dict.fromkeys(recipe_ids, 0)}
+        rows = IngredientVolume.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows:
+            extra[ingredient_id] = extra.get(
+                ingredient_id, frozenset()) | {recipe_id}
+            sizes[recipe_id] += 1
+        # Одно присваивание: поиск в других потоках видит либо старую,
+        # либо новую дельту целиком.
+        self.delta = (patched | recipe_ids, extra, sizes)
+
+    def search(self, ingredient_ids):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов:
+        последовательность (id рецепта, найдено, не хватает), сначала
+        те, где найдено больше и не хватает меньше. Упорядочивается
+        только запрошенный срез, а не все найденные рецепты.
+        """
+        patched, extra, sizes = self.delta
+        ingredient_ids = set(ingredient_ids)
+        covered = Counter()
+        for ingredient_id in ingredient_ids:
+            covered.update(self.postings.get(ingredient_id, ()))
+        if patched:
+            # Строки изменённых рецептов в postings устарели:
+            # их счёт целиком берётся из дельты.
+            for recipe_id in covered.keys() & patched:
+                del covered[recipe_id]
+            for ingredient_id in ingredient_ids:
+                covered.update(extra.get(ingredient_id, ()))
+
+        def size(recipe_id):
+            if recipe_id in sizes:
+                return sizes[recipe_id]
+            return self.sizes[recipe_id]
+
+        return SearchResults(covered, size)
+
+
+class SearchResults:
+    """
+    Результаты поиска для пагинатора. Длина ограничена
+    WHAT_TO_COOK_MAX_RESULTS, срез берётся через heapq.nsmallest
+    по offset + limit элементам.
+    """
+
+    def __init__(self, covered, size):
+        self.covered = covered
+        self.size = size
+
+    def __len__(self):
+        return min(len(self.covered), settings.WHAT_TO_COOK_MAX_RESULTS)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, step = index.indices(len(self))
+        size = self.size
+        top = heapq.nsmallest(
+            stop, self.covered.items(),
+            key=lambda item: (-item[1], size(item[0]) - item[1], -item[0]))
+        return [(recipe_id, count, size(recipe_id) - count)
+                for recipe_id, count in top[start:stop:step]]
+
+
+class SharedIngredientIndex:
+    """Индекс процесса, догоняющий журнал изменений из общего кеша."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._rebuilding = False
+
+    def current_seq(self):
+        seq = cache.get(SEQ_KEY)
+        if seq is None:
+            cache.add(SEQ_KEY, 0, None)
+            seq = cache.get(SEQ_KEY, 0)
+        return seq
+
+    def get(self):
+        seq = self.current_seq()
+        if self._index is None or self._index.seq != seq:
+            with self._lock:
+                if self._index is None:
+                    index = IngredientIndex.build()
+                    index.seq = seq
+                    self._index = index
+                elif self._index.seq != seq:
+                    self.catch_up(self._index, seq)
+        return self._index
+
+    def catch_up(self, index, seq):
+        behind = seq - index.seq
+        if not 0 < behind <= settings.INGREDIENT_INDEX_MAX_PATCH:
+            self.rebuild(seq)
+            return
+        changes = cache.get_many(
+            [CHANGE_KEY.format(n) for n in range(index.seq + 1, seq + 1)])
+        recipe_ids = set()
+        for number in range(index.seq + 1, seq + 1):
+            ids = changes.get(CHANGE_KEY.format(number))
+            if ids is None:
+                if any(CHANGE_KEY.format(later) in changes
+                       for later in range(number + 1, seq + 1)):
+                    # Запись в середине журнала истекла.
+                    self.rebuild(seq)
+                    return
+                # Номер уже выдан, но запись ещё не сделана:
+                # догоним в следующий раз.
+                seq = number - 1
+                break
+            if ids == REBUILD:
+                self.rebuild(seq)
+                return
+            recipe_ids.update(ids)
+        if recipe_ids:
+            index.patch(recipe_ids)
+        index.seq = seq
+        if len(index.delta[0]) > settings.INGREDIENT_INDEX_MAX_PATCHED:
+            self.rebuild(seq)
+
+    def rebuild(self, seq):
+        """
+        Полная пересборка. Внутри транзакции - сразу: фоновый поток
+        с другим соединением не увидел бы незакоммиченных строк.
+        """
+        if connection.in_atomic_block:
+            index = IngredientIndex.build()
+            index.seq = seq
+            self._index = index
+            return
+        # До замены отвечает прежний индекс, журнал за это время
+        # не перечитывается.
+        self._index.seq = seq
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            seq = self.current_seq()
+            index = IngredientIndex.build()
+            index.seq = seq
+            self._index = index
+        except Exception:
+            logger.exception('Не удалось пересобрать индекс ингредиентов')
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def log(self, value):
+        self.current_seq()
+        seq = cache.incr(SEQ_KEY)
+        cache.set(CHANGE_KEY.format(seq), value,
+                  settings.INGREDIENT_INDEX_LOG_TIMEOUT)
+
+    def changed(self, recipe_ids):
+        """Записывает в журнал рецепты с изменённым составом."""
+        self.log(sorted(recipe_ids))
+
+    def invalidate(self):
+        """Полная пересборка во всех процессах, например после импорта."""
+        self.log(REBUILD)
+
+
+ingredient_index = SharedIngredientIndex()
@@ -0,0 +1,50 @@
+"""Данные, которые живут в памяти процесса и сбрасываются
+при смене версии в общем кеше."""
+import threading
+import uuid
+
+from django.core.cache import cache
+
+
+class CacheVersion:
+    """Версия данных в общем кеше; bump() меняет её во всех процессах."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def get(self):
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, uuid.uuid4().hex, None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        cache.set(self.key, uuid.uuid4().hex, None)
+
+
+class ProcessLocal:
+    """
+    Лениво загружает значение через loader и хранит его в процессе.
+    Версия хранится в общем кеше: invalidate() в любом процессе
+    заставляет остальные перезагрузить данные при следующем обращении.
+    """
+
+    def __init__(self, version_key, loader):
+        self.version = CacheVersion(version_key)
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        version = self.version.get()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._value = self.loader()
+                    self._version = version
+        return self._value
+
+    def invalidate(self):
+        self.version.bump()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+
+
+def scan(path, root):
+    """Файлы каталога рекурсивно: (имя относительно root, stat)."""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan(entry.path, root)
+            elif entry.is_file(follow_symlinks=False):
+                name = os.path.relpath(entry.path, root)
+                yield name.replace(os.sep, '/'), entry.stat()
+
+
+class Command(BaseCommand):
+    help = ('Удаление или перенос в карантин файлов изображений, '
+            'на которые не ссылается ни один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+        parser.add_argument(
+            '--quarantine', nargs='?', const=settings.MEDIA_QUARANTINE_DIR,
+            help='Переносить файлы в каталог, по умолчанию '
+                 'MEDIA_QUARANTINE_DIR, вместо удаления')
+        parser.add_argument(
+            '--grace-hours', type=float,
+            default=settings.MEDIA_GC_GRACE_HOURS,
+            help='Не трогать файлы, изменённые за это время')
+        parser.add_argument('--rate', type=float,
+                            help='Не больше стольких файлов в секунду')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        upload_to = Recipe._meta.get_field('image').upload_to
+        path = storage.path(upload_to)
+        if not os.path.isdir(path):
+            raise CommandError(f'Нет каталога {path}')
+        self.options = options
+        self.storage_root = storage.path('')
+        self.removed = self.size = 0
+        self.next_at = time.monotonic()
+        deadline = time.time() - options['grace_hours'] * 3600
+        scanned = 0
+        batch = {}
+        for name, stat in scan(path, self.storage_root):
+            scanned += 1
+            if stat.st_mtime > deadline:
+                continue
+            batch[name] = stat.st_size
+            if len(batch) >= options['batch_size']:
+                self.collect(batch)
+                batch = {}
+        if batch:
+            self.collect(batch)
+        verb = 'К удалению' if options['dry_run'] else 'Убрано'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {scanned}. {verb}: {self.removed}, '
+            f'{self.size / 1024 / 1024:.1f} МБ'))
+
+    def collect(self, batch):
+        referenced = set(Recipe.objects.filter(
+            image__in=list(batch)).values_list('image', flat=True))
+        for name, size in batch.items():
+            if name in referenced:
+                continue
+            self.throttle()
+            if self.options['verbosity'] > 1 or self.options['dry_run']:
+                self.stdout.write(name)
+            if not self.options['dry_run'] and not self.remove(name):
+                continue
+            self.removed += 1
+            self.size += size
+
+    def remove(self, name):
+        source = os.path.join(self.storage_root, name)
+        try:
+            if self.options['quarantine']:
+                target = os.path.join(self.options['quarantine'], name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(source, target)
+            else:
+                os.remove(source)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def throttle(self):
+        if not self.options['rate'] or self.options['dry_run']:
+            return
+        delay = self.next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_at = (max(self.next_at, time.monotonic())
+                        + 1 / self.options['rate'])
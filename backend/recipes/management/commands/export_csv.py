@@ -0,0 +1,46 @@
+from django.apps import apps
+from django.core.exceptions import FieldError
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.csv_export import EXPORT_COLUMNS, iter_csv
+from recipes.ndjson import open_stream
+
+
+class Command(BaseCommand):
+    help = ('Потоковая выгрузка рецептов, избранного, корзин или '
+            'ингредиентов рецептов в CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=[
+            label.split('.')[1].lower() for label in EXPORT_COLUMNS])
+        parser.add_argument('output', help='Путь к файлу, *.gz или -')
+        parser.add_argument('--filter', action='append', default=[],
+                            metavar='ПОЛЕ=ЗНАЧЕНИЕ',
+                            help='Например recipe__tags__slug=breakfast')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        model = apps.get_model('recipes', options['model'])
+        lookups = {}
+        for item in options['filter']:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f'Фильтр без значения: {item}')
+            lookups[key] = value
+        try:
+            queryset = model.objects.filter(**lookups)
+        except FieldError as error:
+            raise CommandError(error)
+        if any('__' in key for key in lookups):
+            queryset = queryset.distinct()
+        stream = open_stream(options['output'], 'w')
+        count = -1
+        try:
+            for line in iter_csv(queryset, options['chunk_size']):
+                stream.write(line)
+                count += 1
+        finally:
+            stream.flush()
+            if options['output'] != '-':
+                stream.close()
+        self.stderr.write(f'{model._meta.label_lower}: {count}')
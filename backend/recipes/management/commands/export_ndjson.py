@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipes.ndjson import get_models, open_stream
+
+
+class Command(BaseCommand):
+    help = ('Потоковая выгрузка пользователей, рецептов, подписок, '
+            'избранного и корзин в NDJSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Путь к файлу, *.gz или -')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        stream = open_stream(options['output'], 'w')
+        try:
+            for model in get_models():
+                label = model._meta.label_lower
+                rows = model.objects.order_by('pk').values().iterator(
+                    chunk_size=options['chunk_size'])
+                count = 0
+                for fields in rows:
+                    stream.write(encoder.encode(
+                        {'model': label, 'fields': fields}))
+                    stream.write('\n')
+                    count += 1
+                self.stderr.write(f'{label}: {count}')
+        finally:
+            stream.flush()
+            if options['output'] != '-':
+                stream.close()
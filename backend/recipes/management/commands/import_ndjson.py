@@ -0,0 +1,71 @@
+import json
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from recipes.ingredient_index import ingredient_index
+from recipes.ndjson import EXPORT_MODELS, open_stream
+from recipes.registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Загрузка NDJSON, выгруженного export_ndjson, '
+            'пачками через bulk_create.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Путь к файлу, *.gz или -')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--ignore-conflicts', action='store_true',
+                            help='Пропускать уже существующие записи')
+
+    def handle(self, *args, **options):
+        allowed = {label.lower() for label in EXPORT_MODELS}
+        batch_size = options['batch_size']
+        ignore_conflicts = options['ignore_conflicts']
+        model = None
+        batch = []
+        counts = {}
+
+        def flush():
+            if batch:
+                model.objects.bulk_create(
+                    batch, batch_size=batch_size,
+                    ignore_conflicts=ignore_conflicts)
+                counts[model] = counts.get(model, 0) + len(batch)
+                batch.clear()
+
+        stream = open_stream(options['input'], 'r')
+        try:
+            with transaction.atomic():
+                for number, line in enumerate(stream, start=1):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record['model'] not in allowed:
+                        raise CommandError(
+                            f'Строка {number}: неизвестная модель '
+                            f'{record["model"]}')
+                    current = apps.get_model(record['model'])
+                    if current is not model:
+                        flush()
+                        model = current
+                    batch.append(model(**record['fields']))
+                    if len(batch) >= batch_size:
+                        flush()
+                flush()
+                self.reset_sequences(list(counts))
+            registry.invalidate()
+            ingredient_index.invalidate()
+        finally:
+            if options['input'] != '-':
+                stream.close()
+        for loaded, count in counts.items():
+            self.stdout.write(f'{loaded._meta.label_lower}: {count}')
+
+    def reset_sequences(self, models):
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.snapshot import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Пересборка снимков тегов, ингредиентов и авторов рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--missing', action='store_true',
+                            help='Только рецепты без снимка')
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['missing']:
+            queryset = queryset.filter(snapshot={})
+        refresh_snapshots(queryset, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Снимки рецептов обновлены'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import SimilarRecipe
+from recipes.similarity import FeatureIndex
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчёт таблицы похожих рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def save_batch(self, recipe_ids, batch):
+        """
+        Строки заменяются пачками, каждая в своей транзакции:
+        блокировки держатся только на строках пачки, и update_similar
+        не ждёт конца всего пересчёта.
+        """
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+            SimilarRecipe.objects.bulk_create(batch)
+        return len(batch)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        index = FeatureIndex.load()
+        self.stdout.write(f'Загружено рецептов: {len(index.features)}')
+        recipe_ids = []
+        batch = []
+        total = 0
+        for recipe_id, neighbours in index:
+            recipe_ids.append(recipe_id)
+            batch.extend(
+                SimilarRecipe(recipe_id=recipe_id, similar_id=pk,
+                              score=score)
+                for pk, score in neighbours
+            )
+            if len(batch) >= batch_size:
+                total += self.save_batch(recipe_ids, batch)
+                recipe_ids = []
+                batch = []
+        total += self.save_batch(recipe_ids, batch)
+        # Рецепты без ингредиентов и тегов в индекс не попали.
+        SimilarRecipe.objects.filter(recipe__ingredientvolume=None,
+                                     recipe__tags=None).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено пар похожих рецептов: {total}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recipes.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт популярных рецептов по новым добавлениям '
+            'в избранное и корзину. Запускается периодически, '
+            'например раз в несколько минут; пока идёт один запуск, '
+            'следующий пропускается.')
+
+    def handle(self, *args, **options):
+        result = update_trending()
+        if result is None:
+            self.stdout.write(self.style.WARNING(
+                'Предыдущий запуск ещё не закончился, пропуск'))
+            return
+        recipes, total = result
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов с новыми событиями: {recipes}, '
+            f'в рейтинге: {total}'))
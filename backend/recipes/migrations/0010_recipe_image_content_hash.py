@@ -0,0 +1,19 @@
+# Generated by Django 3.2.14 on 2026-10-19 19:19
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, storage=recipes.storage.ContentHashStorage(), upload_to='recipes', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.14 on 2026-10-19 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='snapshot',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Снимок тегов, ингредиентов и автора'),
+        ),
+    ]
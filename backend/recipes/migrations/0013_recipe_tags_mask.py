@@ -0,0 +1,37 @@
+# Generated by Django 3.2.14 on 2026-10-19 19:43
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+TAGS_MASK_BITS = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = defaultdict(int)
+    rows = Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id').iterator()
+    for recipe_id, tag_id in rows:
+        if tag_id < TAGS_MASK_BITS:
+            masks[recipe_id] |= 1 << tag_id
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe_id, tags_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ('tags_mask',), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Битовая маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.14 on 2026-10-19 21:10
+
+import datetime
+
+from django.db import migrations
+from django.db.models import Min
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def backfill_created(apps, schema_editor):
+    """
+    0014 проставила всем старым строкам одно и то же время миграции,
+    и первый пересчёт популярности принял бы их за свежие события.
+    Эти строки получают давнюю дату и в рейтинг не попадают.
+    """
+    for name in ('FavoriteRecipe', 'ShoppingCard'):
+        model = apps.get_model('recipes', name)
+        added = model.objects.aggregate(first=Min('created'))['first']
+        if added is not None:
+            model.objects.filter(created=added).update(created=EPOCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_created, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.14 on 2026-10-19 20:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_backfill_created'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favoriterecipe',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='Дата добавления'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcard',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='Дата добавления'),
+        ),
+    ]
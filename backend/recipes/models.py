@@ -1,10 +1,31 @@
+import os
+import time
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from recipes.storage import ContentHashStorage
 
 User = get_user_model()
 
+# Бит 63 в BigIntegerField знаковый, поэтому в маске теги с id до 62.
+TAGS_MASK_BITS = 63
+
+
+def tags_mask(tag_ids):
+    """
+    Битовая маска тегов. Теги, которые в неё не помещаются,
+    пропускаются: фильтр по ним идёт через таблицу связей.
+    """
+    mask = 0
+    for tag_id in tag_ids:
+        if tag_id < TAGS_MASK_BITS:
+            mask |= 1 << tag_id
+    return mask
+
 
 class Tag(models.Model):
     """Модель для реализации тегов."""
@@ -95,7 +116,9 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes',
+        storage=ContentHashStorage(),
         verbose_name='Изображение',
+        db_index=True,
         blank=False
     )
     text = models.TextField(
@@ -120,15 +143,72 @@ class Recipe(models.Model):
         related_name='recipies',
         blank=False
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    snapshot = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Снимок тегов, ингредиентов и автора'
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Битовая маска тегов'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-id',)
+        indexes = (
+            models.Index(fields=('author', '-id'),
+                         name='recipe_author_id_idx'),
+        )
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def refresh_tags_mask(cls, recipe_ids):
+        """Пересчитывает tags_mask рецептов по таблице связей."""
+        tag_ids = {recipe_id: [] for recipe_id in recipe_ids}
+        rows = cls.tags.through.objects.filter(
+            recipe_id__in=tag_ids).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in rows:
+            tag_ids[recipe_id].append(tag_id)
+        cls.objects.bulk_update(
+            [cls(id=recipe_id, tags_mask=tags_mask(ids))
+             for recipe_id, ids in tag_ids.items()],
+            ('tags_mask',), batch_size=500)
+
+    @classmethod
+    def release_image(cls, name):
+        """
+        Удаляет файл изображения после коммита, если на него больше
+        не ссылается ни один рецепт: одинаковые картинки хранятся
+        в одном файле. Недавно изменённые файлы мог только что
+        переиспользовать другой, ещё не закоммиченный запрос,
+        их уберёт collect_media.
+        """
+        if name:
+            transaction.on_commit(lambda: cls.delete_unused_image(name))
+
+    @classmethod
+    def delete_unused_image(cls, name):
+        storage = cls._meta.get_field('image').storage
+        deadline = time.time() - settings.MEDIA_GC_GRACE_HOURS * 3600
+        try:
+            if os.path.getmtime(storage.path(name)) > deadline:
+                return
+        except OSError:
+            return
+        if cls.objects.filter(image=name).exists():
+            return
+        storage.delete(name)
+
 
 class IngredientVolume(models.Model):
     """Модель описывает количество ингредиента в рецепте."""
@@ -178,6 +258,13 @@ class FavoriteRecipe(models.Model):
         related_name='favorite_recipe',
         on_delete=models.CASCADE
     )
+    # Не auto_now_add: import_ndjson сохраняет выгруженные даты.
+    created = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -207,6 +294,13 @@ class ShoppingCard(models.Model):
         related_name='cart',
         on_delete=models.CASCADE
     )
+    # Не auto_now_add: import_ndjson сохраняет выгруженные даты.
+    created = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Рецепт в корзине'
@@ -220,3 +314,59 @@ class ShoppingCard(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил в корзину {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель хранит top-K похожих рецептов для каждого рецепта."""
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='neighbours',
+        on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        related_name='neighbour_of',
+        on_delete=models.CASCADE
+    )
+    score = models.FloatField(verbose_name='Косинусная близость')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('-score',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='uniq_recipe-similar_pair'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} похож на {self.similar} ({self.score:.2f})'
+
+
+class RecipeTrend(models.Model):
+    """
+    Рейтинг популярности рецепта с экспоненциальным затуханием.
+    Все строки пересчитаны на момент computed_at командой
+    update_trending, рецепты с малым весом из таблицы удаляются.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='trend',
+        on_delete=models.CASCADE
+    )
+    score = models.FloatField(verbose_name='Рейтинг', db_index=True)
+    computed_at = models.DateTimeField(verbose_name='Дата расчёта')
+
+    class Meta:
+        verbose_name = 'Популярный рецепт'
+        verbose_name_plural = 'Популярные рецепты'
+        ordering = ('-score',)
+
+    def __str__(self):
+        return f'{self.recipe} ({self.score:.2f})'
@@ -0,0 +1,39 @@
+"""Потоковый экспорт и импорт данных в формате NDJSON.
+
+Каждая строка файла - одна запись вида
+{"model": "recipes.recipe", "fields": {...}}. Модели выгружаются
+в порядке зависимостей по внешним ключам, поэтому при загрузке
+строки можно сохранять пачками по мере чтения.
+"""
+import gzip
+import io
+import sys
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+
+EXPORT_MODELS = (
+    get_user_model()._meta.label,
+    'recipes.Tag',
+    'recipes.Ingredient',
+    'recipes.Recipe',
+    'recipes.Recipe_tags',
+    'recipes.IngredientVolume',
+    'users.Follow',
+    'recipes.FavoriteRecipe',
+    'recipes.ShoppingCard',
+)
+
+
+def get_models():
+    return [apps.get_model(label) for label in EXPORT_MODELS]
+
+
+def open_stream(path, mode):
+    """Файл, stdin/stdout для '-', gzip для путей *.gz."""
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        return io.TextIOWrapper(stream.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
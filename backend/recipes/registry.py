@@ -0,0 +1,80 @@
+"""Справочник тегов и ингредиентов в памяти процесса.
+
+Обе таблицы небольшие и меняются редко, поэтому сериализаторы
+берут названия и единицы измерения отсюда, а не из JOIN.
+Версия справочника хранится в общем кеше и сдвигается сигналами
+при изменении тегов и ингредиентов.
+"""
+from recipes.local_cache import ProcessLocal
+from recipes.models import Ingredient, Tag
+
+
+class TagRecord:
+    __slots__ = ('id', 'name', 'color', 'slug')
+
+    def __init__(self, id, name, color, slug):
+        self.id = id
+        self.name = name
+        self.color = color
+        self.slug = slug
+
+    def as_dict(self):
+        return {'id': self.id, 'name': self.name,
+                'color': self.color, 'slug': self.slug}
+
+    def as_list(self):
+        return [self.id, self.name, self.color, self.slug]
+
+
+class IngredientRecord:
+    __slots__ = ('id', 'name', 'measurement_unit')
+
+    def __init__(self, id, name, measurement_unit):
+        self.id = id
+        self.name = name
+        self.measurement_unit = measurement_unit
+
+
+class Registry:
+    """
+    tags и ingredients: id -> запись со __slots__.
+    Если id нет в справочнике (например, строки загружены
+    bulk_create без сигналов), запись читается из базы
+    и досохраняется; несуществующие id не кешируются.
+    """
+
+    def __init__(self):
+        self.tags = {}
+        self.ingredients = {}
+
+    @classmethod
+    def build(cls):
+        registry = cls()
+        for row in Tag.objects.values_list('id', 'name', 'color', 'slug'):
+            registry.tags[row[0]] = TagRecord(*row)
+        ingredients = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit').iterator()
+        for row in ingredients:
+            registry.ingredients[row[0]] = IngredientRecord(*row)
+        return registry
+
+    def tag(self, pk):
+        record = self.tags.get(pk)
+        if record is None:
+            row = Tag.objects.filter(pk=pk).values_list(
+                'id', 'name', 'color', 'slug').first()
+            if row is not None:
+                record = self.tags[row[0]] = TagRecord(*row)
+        return record
+
+    def ingredient(self, pk):
+        record = self.ingredients.get(pk)
+        if record is None:
+            row = Ingredient.objects.filter(pk=pk).values_list(
+                'id', 'name', 'measurement_unit').first()
+            if row is not None:
+                record = self.ingredients[row[0]] = IngredientRecord(*row)
+        return record
+
+
+registry = ProcessLocal('registry_version', Registry.build)
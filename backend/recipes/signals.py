@@ -0,0 +1,159 @@
+"""Пересборка снимков рецептов, маски тегов, справочника процесса
+и индекса ингредиентов при изменении тегов, ингредиентов и авторов."""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import Signal, receiver
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Ingredient, IngredientVolume, Recipe, Tag,
+                            tags_mask)
+from recipes.registry import registry
+from recipes.snapshot import AUTHOR_FIELDS, refresh_snapshots
+
+logger = logging.getLogger('recipes.signals')
+
+_pending = threading.local()
+
+# Снимки переписаны: закешированная выдача рецептов устарела.
+snapshots_refreshed = Signal()
+
+
+def refresh_on_commit(recipe_ids, ingredients=False):
+    """
+    Снимки рецептов пересобираются один раз после коммита, сколько
+    бы их строк ни поменялось в транзакции: админка, например,
+    сохраняет ингредиенты из inline по одному. Рецепты с изменённым
+    составом попадают и в журнал индекса ингредиентов.
+    """
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+        _pending.ingredients = set()
+    _pending.ids.update(recipe_ids)
+    if ingredients:
+        _pending.ingredients.update(recipe_ids)
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending():
+    recipe_ids = getattr(_pending, 'ids', None)
+    if not recipe_ids:
+        return
+    changed = _pending.ingredients
+    _pending.ids = set()
+    _pending.ingredients = set()
+    if len(recipe_ids) > settings.SNAPSHOT_REFRESH_SYNC_LIMIT:
+        threading.Thread(target=refresh_in_background,
+                         args=(sorted(recipe_ids),), daemon=True).start()
+    else:
+        refresh_snapshots(Recipe.objects.filter(id__in=recipe_ids))
+        snapshots_refreshed.send(sender=Recipe)
+    if changed:
+        ingredient_index.changed(changed)
+
+
+def refresh_in_background(recipe_ids):
+    """
+    Правка частого ингредиента или тега в админке задевает большую
+    часть рецептов: снимки пересобираются в фоне, каждая пачка
+    в своей транзакции, а не в запросе админки.
+    """
+    batch_size = settings.SNAPSHOT_REFRESH_SYNC_LIMIT
+    try:
+        for start in range(0, len(recipe_ids), batch_size):
+            refresh_snapshots(Recipe.objects.filter(
+                id__in=recipe_ids[start:start + batch_size]))
+        snapshots_refreshed.send(sender=Recipe)
+    except Exception:
+        logger.exception('Не удалось пересобрать снимки рецептов')
+    finally:
+        connection.close()
+
+
+def recipes_with(**lookup):
+    return Recipe.objects.filter(**lookup).values_list('id', flat=True)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    registry.invalidate()
+    if not created:
+        refresh_on_commit(recipes_with(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    registry.invalidate()
+    if not created:
+        refresh_on_commit(recipes_with(ingredients=instance))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def author_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    refresh_on_commit(recipes_with(author=instance))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_recipes(sender, instance, **kwargs):
+    lookup = 'tags' if sender is Tag else 'ingredients'
+    instance._snapshot_recipes = list(Recipe.objects.filter(
+        **{lookup: instance}).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def refresh_remembered(sender, instance, **kwargs):
+    registry.invalidate()
+    recipes = getattr(instance, '_snapshot_recipes', None)
+    if recipes:
+        if sender is Tag:
+            Recipe.refresh_tags_mask(recipes)
+        refresh_on_commit(recipes)
+
+
+@receiver(post_save, sender=IngredientVolume)
+@receiver(post_delete, sender=IngredientVolume)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    refresh_on_commit((instance.recipe_id,), ingredients=True)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """tags_mask и снимок пересчитываются при любом изменении recipe.tags."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # Маска ставится и на сам объект: сериализатор потом
+        # сохраняет его целиком и иначе затёр бы новое значение.
+        instance.tags_mask = tags_mask(
+            instance.tags.values_list('id', flat=True))
+        Recipe.objects.filter(pk=instance.pk).update(
+            tags_mask=instance.tags_mask)
+        recipe_ids = (instance.pk,)
+    elif pk_set:
+        recipe_ids = pk_set
+        Recipe.refresh_tags_mask(recipe_ids)
+    elif action == 'post_clear':
+        recipe_ids = getattr(instance, '_cleared_recipes', ())
+        Recipe.refresh_tags_mask(recipe_ids)
+    else:
+        return
+    refresh_on_commit(recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def remember_cleared(sender, instance, action, reverse, **kwargs):
+    """tag.recipe_set.clear() не передаёт pk_set, запоминаем заранее."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_recipes = list(
+            instance.recipe_set.values_list('id', flat=True))
@@ -0,0 +1,170 @@
+"""Похожие рецепты по пересечению ингредиентов и тегов.
+
+Рецепт представлен разреженным бинарным вектором признаков:
+ингредиент кодируется как ``id << 1``, тег как ``id << 1 | 1``.
+Для таких векторов косинусная близость равна
+``|A ∩ B| / sqrt(|A| * |B|)``.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from recipes.models import IngredientVolume, Recipe, SimilarRecipe
+
+RecipeTag = Recipe.tags.through
+
+
+def cosine(features, other):
+    """Близость двух бинарных векторов: множества и итерируемого."""
+    if not features or not other:
+        return 0.0
+    common = len(features.intersection(other))
+    if not common:
+        return 0.0
+    return common / math.sqrt(len(features) * len(other))
+
+
+def load_features(recipe_ids):
+    """Признаки указанных рецептов: {recipe_id: set(признаков)}."""
+    features = defaultdict(set)
+    volumes = IngredientVolume.objects.filter(
+        recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in volumes:
+        features[recipe_id].add(ingredient_id << 1)
+    tags = RecipeTag.objects.filter(
+        recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in tags:
+        features[recipe_id].add(tag_id << 1 | 1)
+    return features
+
+
+def _top(scores, count):
+    return heapq.nlargest(
+        count,
+        ((pk, score) for pk, score in scores.items() if score > 0),
+        key=itemgetter(1))
+
+
+def rare_ingredients(ingredient_ids, max_posting):
+    """
+    Ингредиенты не более чем в max_posting рецептах, как в
+    FeatureIndex.neighbours. Каждый подсчёт ограничен LIMIT
+    и не читает все строки соли или воды.
+    """
+    return [
+        ingredient_id for ingredient_id in ingredient_ids
+        if IngredientVolume.objects.filter(
+            ingredient_id=ingredient_id)[:max_posting + 1].count()
+        <= max_posting
+    ]
+
+
+def update_similar(recipe):
+    """
+    Инкрементальный пересчёт соседей рецепта после изменения
+    его ингредиентов или тегов. Обновляет и списки кандидатов,
+    в которых этот рецепт мог появиться или изменить позицию.
+    """
+    count = settings.SIMILAR_RECIPES_COUNT
+    own = load_features([recipe.id])[recipe.id]
+    ingredient_ids = rare_ingredients(
+        [feature >> 1 for feature in own if not feature & 1],
+        settings.SIMILAR_MAX_POSTING)
+    candidates = list(
+        IngredientVolume.objects.filter(ingredient_id__in=ingredient_ids)
+        .exclude(recipe_id=recipe.id)
+        .values('recipe_id')
+        .annotate(common=Count('id'))
+        .order_by('-common')
+        .values_list('recipe_id', flat=True)[:settings.SIMILAR_CANDIDATES]
+    )
+    features = load_features(candidates)
+    scores = {pk: cosine(own, features[pk]) for pk in candidates}
+
+    affected = SimilarRecipe.objects.filter(
+        similar_id=recipe.id).values('recipe_id')
+    neighbours = defaultdict(dict)
+    existing = SimilarRecipe.objects.filter(
+        Q(recipe_id__in=candidates) | Q(recipe_id__in=affected)
+    ).values_list('recipe_id', 'similar_id', 'score')
+    for recipe_id, similar_id, score in existing:
+        neighbours[recipe_id][similar_id] = score
+    for recipe_id, row in neighbours.items():
+        row.pop(recipe.id, None)
+        if scores.get(recipe_id):
+            row[recipe.id] = scores[recipe_id]
+    for recipe_id, score in scores.items():
+        if score > 0 and recipe_id not in neighbours:
+            neighbours[recipe_id][recipe.id] = score
+    neighbours[recipe.id] = dict(_top(scores, count))
+
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=neighbours).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, row in neighbours.items()
+            for similar_id, score in _top(row, count)
+        )
+
+
+class FeatureIndex:
+    """
+    Компактный индекс всех рецептов для полного пересчёта:
+    признаки рецептов и списки рецептов по ингредиентам
+    хранятся в array('I'), а не в множествах Python.
+    """
+
+    def __init__(self):
+        self.features = {}
+        self.postings = defaultdict(lambda: array('I'))
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        index = cls()
+        features = defaultdict(lambda: array('I'))
+        volumes = IngredientVolume.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id').iterator(chunk_size=chunk_size)
+        for recipe_id, ingredient_id in volumes:
+            features[recipe_id].append(ingredient_id << 1)
+            index.postings[ingredient_id].append(recipe_id)
+        tags = RecipeTag.objects.order_by().values_list(
+            'recipe_id', 'tag_id').iterator(chunk_size=chunk_size)
+        for recipe_id, tag_id in tags:
+            features[recipe_id].append(tag_id << 1 | 1)
+        index.features = dict(features)
+        return index
+
+    def neighbours(self, recipe_id, count, candidates, max_posting):
+        """
+        Кандидаты набираются только по достаточно редким
+        ингредиентам, иначе соль и вода делают обход квадратичным.
+        """
+        own = self.features[recipe_id]
+        counter = Counter()
+        for feature in own:
+            if feature & 1:
+                continue
+            posting = self.postings[feature >> 1]
+            if len(posting) <= max_posting:
+                counter.update(posting)
+        counter.pop(recipe_id, None)
+        own = set(own)
+        scores = {
+            pk: cosine(own, self.features[pk])
+            for pk, _ in counter.most_common(candidates)
+        }
+        return _top(scores, count)
+
+    def __iter__(self):
+        count = settings.SIMILAR_RECIPES_COUNT
+        for recipe_id in self.features:
+            yield recipe_id, self.neighbours(
+                recipe_id, count, settings.SIMILAR_CANDIDATES,
+                settings.SIMILAR_MAX_POSTING)
@@ -0,0 +1,84 @@
+"""Денормализованный снимок рецепта.
+
+Снимок хранит не зависящую от пользователя часть представления:
+теги, ингредиенты с названиями и единицами и карточку автора.
+Поля хранятся списками в фиксированном порядке, а не словарями,
+потому что jsonb в PostgreSQL не сохраняет порядок ключей.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from recipes.models import IngredientVolume, Recipe
+from recipes.registry import registry
+
+User = get_user_model()
+
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'amount', 'measurement_unit')
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+def build_snapshots(recipes):
+    """
+    Снимки для рецептов за три запроса: {id рецепта: снимок}.
+    Теги и ингредиенты берутся из справочника процесса.
+    """
+    ids = [recipe.id for recipe in recipes]
+    known = registry.get()
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(recipe_id__in=ids).order_by(
+        'id').values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in rows:
+        tags[recipe_id].append(known.tag(tag_id).as_list())
+
+    ingredients = defaultdict(list)
+    rows = IngredientVolume.objects.filter(recipe_id__in=ids).order_by(
+        'id').values_list('recipe_id', 'ingredient_id', 'amount')
+    for recipe_id, ingredient_id, amount in rows:
+        ingredient = known.ingredient(ingredient_id)
+        ingredients[recipe_id].append([
+            ingredient.id, ingredient.name, amount,
+            ingredient.measurement_unit])
+
+    authors = {
+        row[1]: list(row) for row in User.objects.filter(
+            id__in={recipe.author_id for recipe in recipes}
+        ).values_list(*AUTHOR_FIELDS)
+    }
+    return {
+        recipe.id: {
+            'tags': tags[recipe.id],
+            'ingredients': ingredients[recipe.id],
+            'author': authors[recipe.author_id],
+        }
+        for recipe in recipes
+    }
+
+
+def refresh_snapshots(queryset, batch_size=500):
+    """
+    Пересобирает снимки рецептов из queryset пачками.
+    updated_at тоже сдвигается: представление рецепта изменилось.
+    """
+    ids = list(queryset.order_by().values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        recipes = list(Recipe.objects.filter(
+            id__in=ids[start:start + batch_size]).only('id', 'author_id'))
+        snapshots = build_snapshots(recipes)
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.snapshot = snapshots[recipe.id]
+            recipe.updated_at = now
+        Recipe.objects.bulk_update(recipes, ('snapshot', 'updated_at'))
+
+
+def unpack_snapshot(snapshot):
+    """Снимок в виде словарей в порядке полей RecipeSerializer."""
+    return {
+        'tags': [dict(zip(TAG_FIELDS, tag)) for tag in snapshot['tags']],
+        'ingredients': [dict(zip(INGREDIENT_FIELDS, ingredient))
+                        for ingredient in snapshot['ingredients']],
+        'author': dict(zip(AUTHOR_FIELDS, snapshot['author'])),
+    }
@@ -0,0 +1,37 @@
+"""Хранилище изображений с адресацией по содержимому."""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """
+    Имя файла - sha256 его содержимого: recipes/ab/ab12…ef.jpg.
+    Одинаковые изображения хранятся один раз, а файл по имени
+    никогда не меняется, поэтому nginx может кешировать его вечно.
+    """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), digest[:2],
+                            digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = self.content_name(name, content)
+        try:
+            # Свежее время изменения защищает переиспользованный файл
+            # от collect_media на срок grace-периода.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length=max_length)
+        return name
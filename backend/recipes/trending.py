@@ -0,0 +1,103 @@
+"""Инкрементальный расчёт популярности рецептов.
+
+Рейтинг рецепта - сумма весов добавлений в избранное и в корзину,
+каждый вес затухает экспоненциально с периодом полураспада
+TRENDING_HALF_LIFE_HOURS. Все строки RecipeTrend хранят рейтинг
+на один и тот же момент computed_at, поэтому очередной запуск
+умножает их одним UPDATE на общий множитель и добавляет только
+события, появившиеся после прошлого запуска.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from recipes.models import FavoriteRecipe, Recipe, RecipeTrend, ShoppingCard
+
+
+# Ключ advisory lock PostgreSQL для update_trending.
+LOCK_ID = 0x7472656e64
+
+
+def acquire_lock():
+    """
+    Блокировка до конца транзакции: параллельный запуск прочитал бы
+    тот же computed_at и добавил те же события второй раз.
+    SQLite и так выполняет пишущие транзакции по одной.
+    """
+    if connection.vendor != 'postgresql':
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', (LOCK_ID,))
+        return cursor.fetchone()[0]
+
+
+def decay_rate():
+    """Показатель затухания, 1/с."""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def collect_events(since, until, rate):
+    """Вклад событий из (since, until] на момент until по рецептам."""
+    scores = defaultdict(float)
+    sources = (
+        (FavoriteRecipe, settings.TRENDING_FAVORITE_WEIGHT),
+        (ShoppingCard, settings.TRENDING_CART_WEIGHT),
+    )
+    for model, weight in sources:
+        rows = model.objects.filter(
+            created__gt=since, created__lte=until).values_list(
+                'recipe_id', 'created').iterator()
+        for recipe_id, created in rows:
+            age = (until - created).total_seconds()
+            scores[recipe_id] += weight * math.exp(-rate * age)
+    return scores
+
+
+@transaction.atomic
+def update_trending(now=None):
+    """
+    Пересчитывает таблицу на момент now минус TRENDING_LAG_SECONDS:
+    события из ещё не завершённых транзакций попадут в следующий
+    запуск. Если другой запуск ещё идёт, ничего не делает
+    и возвращает None, иначе (рецептов с новыми событиями,
+    строк в таблице).
+    """
+    if not acquire_lock():
+        return None
+    until = (now or timezone.now()) - timedelta(
+        seconds=settings.TRENDING_LAG_SECONDS)
+    rate = decay_rate()
+    since = RecipeTrend.objects.aggregate(
+        last=Max('computed_at'))['last']
+    if since is None:
+        # Пустая таблица: события старше десяти периодов полураспада
+        # весят меньше тысячной доли и не учитываются.
+        since = until - timedelta(
+            hours=settings.TRENDING_HALF_LIFE_HOURS * 10)
+    if until <= since:
+        return 0, RecipeTrend.objects.count()
+    factor = math.exp(-rate * (until - since).total_seconds())
+    RecipeTrend.objects.update(score=F('score') * factor,
+                               computed_at=until)
+
+    scores = collect_events(since, until, rate)
+    existing = RecipeTrend.objects.in_bulk(list(scores))
+    for recipe_id, trend in existing.items():
+        trend.score += scores[recipe_id]
+    RecipeTrend.objects.bulk_update(existing.values(), ('score',),
+                                    batch_size=500)
+    # Рецепт мог быть удалён после того, как событие прочитано.
+    new_ids = Recipe.objects.filter(
+        id__in=[pk for pk in scores if pk not in existing]).values_list(
+            'id', flat=True)
+    RecipeTrend.objects.bulk_create(
+        (RecipeTrend(recipe_id=pk, score=scores[pk], computed_at=until)
+         for pk in new_ids), batch_size=500)
+    RecipeTrend.objects.filter(
+        score__lt=settings.TRENDING_MIN_SCORE).delete()
+    return len(scores), RecipeTrend.objects.count()